@@ -423,6 +423,68 @@ def crunch_graphical_model(pgm_path, path_datasets):
         plot(fig, filename=pgm_path.split(sep)[-1] + '.html')
 
 
+def benchmark_population_vote(dataset_path, config_file, k=10, n_repeats=10):
+    """
+    Compares the time for scoring a test set with the k best individuals of the final population merged
+    into a single predictor, against running k separate predict calls.
+
+    :type dataset_path: str
+    :param dataset_path: Path to a folder with <dataset_name>_train.arff and <dataset_name>_test.arff files.
+    :type config_file: dict
+    :param config_file: Algorithm parameters, as in config.json.
+    :type k: int
+    :param k: optional - number of individuals which vote. Defaults to 10.
+    :type n_repeats: int
+    :param n_repeats: optional - number of times each scoring method is repeated. Defaults to 10.
+    """
+
+    dataset_name = dataset_path.split(os.sep)[-1]
+
+    train_df = load_dataframe(load_arff(os.path.join(dataset_path, dataset_name + '_train.arff')))
+    test_df = load_dataframe(load_arff(os.path.join(dataset_path, dataset_name + '_test.arff')))
+
+    inst = Ardennes(
+        n_individuals=config_file['n_individuals'],
+        max_height=config_file['tree_height'],
+        n_iterations=config_file['n_iterations']
+    )
+
+    inst.fit(
+        train_df=train_df,
+        decile=config_file['decile'],
+        test_df=test_df,
+        verbose=False,
+        multi_tests=1,
+        random_state=config_file['random_state']
+    )
+
+    k = min(k, inst.n_individuals)
+    x_test = test_df[test_df.columns[:-1]]
+    y_test_true = test_df[test_df.columns[-1]]
+
+    t1 = dt.now()
+    for i in xrange(n_repeats):
+        separate_preds = [ind.predict(x_test) for ind in inst.population[:k]]
+    t2 = dt.now()
+    separate_time = (t2 - t1).total_seconds() / n_repeats
+
+    t1 = dt.now()
+    for i in xrange(n_repeats):
+        vote_preds = inst.predict_vote(x_test, k=k)
+    t2 = dt.now()
+    vote_time = (t2 - t1).total_seconds() / n_repeats
+
+    voter = inst.get_voter(k)
+    n_separate_nodes = sum([ind.n_nodes - ind.to_arrays()['terminal'].sum() for ind in inst.population[:k]])
+
+    print 'dataset: %s k: %d n_objects: %d' % (dataset_name, k, x_test.shape[0])
+    print 'inner nodes: %d separate, %d shared' % (n_separate_nodes, voter.n_nodes)
+    print '%d separate predict calls: %02.4f secs best individual test acc: %0.6f' % (
+        k, separate_time, accuracy_score(y_test_true, list(separate_preds[0]))
+    )
+    print 'population vote: %02.4f secs test acc: %0.6f' % (vote_time, accuracy_score(y_test_true, vote_preds))
+
+
 def __run__(train_df, test_df=None, **kwargs):
     t1 = dt.now()
 
@@ -437,7 +499,8 @@ def __run__(train_df, test_df=None, **kwargs):
             tree_height=kwargs['tree_height'],
             decile=kwargs['decile'],
             multi_tests=kwargs['multi_tests'],
-            random_state=kwargs['random_state']
+            random_state=kwargs['random_state'],
+            background=True  # disk I/O overlaps with the evolution; close() writes what is still queued
         )
         dbhandler.set_run(kwargs['run'])
         dbhandler.write_attributes(train_df.columns)
@@ -457,7 +520,8 @@ def __run__(train_df, test_df=None, **kwargs):
         verbose=kwargs['verbose'],  # kwargs
         multi_tests=kwargs['multi_tests'],  # kwargs
         random_state=kwargs['random_state'],  # kwargs
-        dbhandler=dbhandler  # kwargs
+        dbhandler=dbhandler,  # kwargs
+        warm_start=kwargs['warm_start'] if 'warm_start' in kwargs else None  # kwargs
     )
 
     ind = inst.predictor
@@ -474,6 +538,12 @@ def __run__(train_df, test_df=None, **kwargs):
     if dbhandler is not None:
         dbhandler.close()
 
+    # the next fold of this run starts from the final model and fittest individuals of this one
+    if 'dict_warm_starts' in kwargs and kwargs['dict_warm_starts'] is not None:
+        kwargs['dict_warm_starts'][kwargs['run']] = inst.warm_start_state(
+            n_elites=int(kwargs['n_individuals'] * kwargs['decile'])
+        )
+
     if 'dict_manager' in kwargs:
         train_hash = DatabaseHandler.get_hash(train_df)
         hashdb = hash((train_hash, kwargs['run']))
@@ -526,6 +596,10 @@ def __train__(dataset_path, tree_height, random_state=None, n_runs=10, n_jobs=8,
     mode = None
     partial_dbs = []
 
+    # in cross-validation, whether each fold starts from the final state of the previous fold of the same run
+    # (see Ardennes.fit). Folds share most of their training data, but are then evolved one after the other
+    warm_start = kwargs['warm_start'] if 'warm_start' in kwargs else False
+
     if 'train' not in files or 'test' not in files:
         mode = 'cross-validation'
 
@@ -547,6 +621,7 @@ def __train__(dataset_path, tree_height, random_state=None, n_runs=10, n_jobs=8,
         for run in xrange(n_runs):
             manager = Manager()
             dict_manager = manager.dict()
+            dict_warm_starts = manager.dict() if warm_start else None
 
             processes = []
 
@@ -570,6 +645,8 @@ def __train__(dataset_path, tree_height, random_state=None, n_runs=10, n_jobs=8,
                         multi_tests=1,
                         random_state=random_state,
                         dict_manager=dict_manager,
+                        warm_start=dict_warm_starts[run] if warm_start and run in dict_warm_starts else None,
+                        dict_warm_starts=dict_warm_starts
                     )
                 )
 
@@ -577,6 +654,9 @@ def __train__(dataset_path, tree_height, random_state=None, n_runs=10, n_jobs=8,
                 p.start()
                 processes.append(p)
 
+                if warm_start:
+                    p.join()  # the next fold starts from the state of this one
+
             for p in processes:
                 p.join()
 
@@ -3,7 +3,7 @@ import json
 # noinspection PyUnresolvedReferences
 from evaluate import evaluate_ardennes, evaluate_j48, \
     crunch_graphical_model,  crunch_result_file, \
-    __train__, crunch_evolution_data
+    __train__, crunch_evolution_data, benchmark_population_vote
 
 
 if __name__ == '__main__':
@@ -36,6 +36,8 @@ if __name__ == '__main__':
     #     validation_mode=_validation_mode
     # )
     # # --------------------------------------------------- #
+    # benchmark_population_vote('datasets/numerical/iris', _config_file, k=10)
+    # # --------------------------------------------------- #
     __train__(
         dataset_path='datasets/numerical/iris',
         # dataset_path='datasets/gene expression/breastCancer',
@@ -0,0 +1,147 @@
+# coding=utf-8
+
+"""
+Readers which go through datasets in fixed-size chunks of rows, so that datasets larger than
+the available memory can be used for scoring.
+"""
+
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+__author__ = 'Henry Cagnini'
+
+
+def iter_arff_chunks(dataset_path, chunk_size):
+    """
+    Reads an arff file in chunks of rows.
+
+    :type dataset_path: str
+    :param dataset_path: Path to the dataset. Must contain the .arff file extension.
+    :type chunk_size: int
+    :param chunk_size: Maximum number of rows per chunk.
+    :rtype: generator
+    :return: A generator of pandas.DataFrame, each one with at most chunk_size rows.
+    """
+
+    columns = []
+    with open(dataset_path, 'r') as f:
+        for line in f:  # header
+            line = line.strip()
+            if len(line) == 0 or line.startswith('%'):
+                continue
+            if line.lower().startswith('@attribute'):
+                # attribute names may be quoted, in which case they may also contain spaces
+                declaration = line.split(None, 1)[1]
+                name = next(csv.reader([declaration], delimiter=' ', quotechar='\'', skipinitialspace=True))[0]
+                columns += [name]
+            elif line.lower().startswith('@data'):
+                break
+
+        rows = []
+        for row in csv.reader(f, delimiter=',', quotechar='\'', skipinitialspace=True):
+            if len(row) == 0 or row[0].startswith('%'):
+                continue
+
+            rows += [row]
+            if len(rows) == chunk_size:
+                yield pd.DataFrame(rows, columns=columns).replace('?', np.nan)
+                rows = []
+
+        if len(rows) > 0:
+            yield pd.DataFrame(rows, columns=columns).replace('?', np.nan)
+
+
+def iter_csv_chunks(dataset_path, chunk_size):
+    """
+    Reads a csv file, with a header line, in chunks of rows.
+
+    :type dataset_path: str
+    :param dataset_path: Path to the dataset. Must contain the .csv file extension.
+    :type chunk_size: int
+    :param chunk_size: Maximum number of rows per chunk.
+    :rtype: generator
+    :return: A generator of pandas.DataFrame, each one with at most chunk_size rows.
+    """
+
+    for chunk in pd.read_csv(dataset_path, sep=',', quotechar='\"', chunksize=chunk_size, na_values='?'):
+        yield chunk
+
+
+def iter_array_chunks(array, chunk_size):
+    """
+    Goes through a (possibly memory-mapped) array in chunks of rows. Only the current chunk is
+    loaded in memory.
+
+    :type array: numpy.ndarray
+    :param array: A two-dimensional array, where each row is an object.
+    :type chunk_size: int
+    :param chunk_size: Maximum number of rows per chunk.
+    :rtype: generator
+    :return: A generator of numpy.ndarray, each one with at most chunk_size rows.
+    """
+
+    for start in xrange(0, array.shape[0], chunk_size):
+        yield np.asarray(array[start:start + chunk_size], dtype=np.float32)
+
+
+def memmap_binary(dataset_path, n_columns):
+    """
+    Memory-maps a raw binary file of float32 values, stored in row-major order.
+
+    :type dataset_path: str
+    :param dataset_path: Path to the binary file.
+    :type n_columns: int
+    :param n_columns: Number of columns of each row.
+    :rtype: numpy.memmap
+    :return: A read-only memory-mapped array with shape (n_rows, n_columns).
+    """
+
+    data = np.memmap(dataset_path, dtype=np.float32, mode='r')
+    assert data.shape[0] % n_columns == 0, ValueError('File size is not a multiple of the number of columns!')
+    return data.reshape(-1, n_columns)
+
+
+def iter_chunks(source, chunk_size, n_columns=None):
+    """
+    Goes through a dataset in chunks of rows, regardless of how it is stored.
+
+    :param source: Either a path to an .arff, .csv, .npy or raw float32 binary file, or a
+        numpy.ndarray or pandas.DataFrame already in memory.
+    :type chunk_size: int
+    :param chunk_size: Maximum number of rows per chunk.
+    :type n_columns: int
+    :param n_columns: optional - number of columns of raw binary files. Ignored for other sources.
+    :rtype: generator
+    :return: A generator of chunks, either as pandas.DataFrame (when column names are available)
+        or as numpy.ndarray.
+    """
+
+    assert chunk_size > 0, ValueError('chunk_size must be a positive integer!')
+
+    if isinstance(source, pd.DataFrame):
+        for start in xrange(0, source.shape[0], chunk_size):
+            yield source.iloc[start:start + chunk_size]
+        return
+
+    if isinstance(source, np.ndarray):
+        for chunk in iter_array_chunks(source, chunk_size):
+            yield chunk
+        return
+
+    extension = os.path.splitext(source)[1].lower()
+
+    if extension == '.arff':
+        gen = iter_arff_chunks(source, chunk_size)
+    elif extension == '.csv':
+        gen = iter_csv_chunks(source, chunk_size)
+    elif extension == '.npy':
+        gen = iter_array_chunks(np.load(source, mmap_mode='r'), chunk_size)
+    else:
+        assert n_columns is not None, ValueError('n_columns must be provided for raw binary files!')
+        gen = iter_array_chunks(memmap_binary(source, n_columns), chunk_size)
+
+    for chunk in gen:
+        yield chunk
@@ -0,0 +1,130 @@
+# coding=utf-8
+
+"""
+Dependency-light module for scoring data with trees induced by Ardennes. Only requires numpy, so that it
+can be imported (and models loaded) without paying the start-up cost of treelib and its dependencies.
+
+Models are stored as uncompressed .npz files, with one flat array per node property:
+
+>>> from scorer import Model
+>>> model = Model.load('my_model.npz')
+>>> predictions = model.predict(data)
+"""
+
+import numpy as np
+
+__author__ = 'Henry Cagnini'
+
+# increase whenever the set of arrays stored in a model file changes
+FORMAT_VERSION = 1
+
+tree_keys = ['left', 'right', 'terminal', 'attributes', 'thresholds', 'classes']
+
+
+def predict_arrays(data, arrays):
+    """
+    Makes predictions for a batch of objects, all at once, with a tree in the format returned by
+    DecisionTree.to_arrays. Objects descend one level of the tree per step.
+
+    :type data: numpy.ndarray
+    :param data: A two-dimensional array where each row is an object.
+    :type arrays: dict
+    :param arrays: A decision tree, as returned by DecisionTree.to_arrays.
+    :rtype: numpy.ndarray
+    :return: The index of the predicted class for each one of the objects.
+    """
+
+    left, right, terminal = arrays['left'], arrays['right'], arrays['terminal']
+    attributes, thresholds = arrays['attributes'], arrays['thresholds']
+    multi_tests = attributes.shape[1]
+
+    current_node = np.zeros(data.shape[0], dtype=np.int32)
+    active = np.arange(data.shape[0])
+
+    while True:
+        active = active[~terminal[current_node[active]]]
+        if active.shape[0] == 0:
+            break
+
+        node = current_node[active]
+
+        go_right = np.zeros(active.shape[0], dtype=np.int32)
+        for i in xrange(multi_tests):
+            go_right += data[active, attributes[node, i]] > thresholds[node, i]
+
+        current_node[active] = np.where(go_right > (multi_tests / 2), right[node], left[node])
+
+    return arrays['classes'][current_node]
+
+
+def save(path, arrays, attributes, class_labels):
+    """
+    Writes a tree to a model file.
+
+    :type path: str
+    :param path: Path to the model file, used as given (i.e. no extension is appended).
+    :type arrays: dict
+    :param arrays: A decision tree, as returned by DecisionTree.to_arrays.
+    :param attributes: Names of the predictive attributes, in the order the tree expects them.
+    :param class_labels: Class labels, in the order of the class indices used by the tree.
+    """
+
+    with open(path, 'wb') as f:  # numpy would append .npz to a path, but not to a file
+        np.savez(
+            f,
+            format_version=np.int32(FORMAT_VERSION),
+            attribute_names=np.array(list(attributes)),
+            class_labels=np.array(list(class_labels)),
+            **{k: arrays[k] for k in tree_keys}
+        )
+
+
+class Model(object):
+    def __init__(self, arrays, attributes, class_labels):
+        """
+
+        :type arrays: dict
+        :param arrays: A decision tree, as returned by DecisionTree.to_arrays.
+        :type attributes: numpy.ndarray
+        :param attributes: Names of the predictive attributes, in the order the tree expects them.
+        :type class_labels: numpy.ndarray
+        :param class_labels: Class labels, in the order of the class indices used by the tree.
+        """
+
+        self.arrays = arrays
+        self.attributes = attributes
+        self.class_labels = class_labels
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a model file written by scorer.save (or DecisionTree.save).
+
+        :type path: str
+        :param path: Path to the model file.
+        :rtype: Model
+        :return: The model.
+        """
+
+        with np.load(path, allow_pickle=False) as f:
+            if int(f['format_version']) != FORMAT_VERSION:
+                raise ValueError('Unsupported model format version: %d' % int(f['format_version']))
+
+            arrays = {k: f[k] for k in tree_keys}
+            return cls(arrays, f['attribute_names'], f['class_labels'])
+
+    def predict(self, data):
+        """
+        Makes predictions for unseen data.
+
+        :param data: Either a two-dimensional numpy.ndarray with predictive attributes in the same order
+            as in the training set, or any object indexable by column names (e.g. a pandas.DataFrame).
+        :rtype: numpy.ndarray
+        :return: An array with the predicted class labels.
+        """
+
+        if hasattr(data, 'columns'):
+            data = data[list(self.attributes)].values
+
+        data = np.asarray(data, dtype=np.float32)
+        return self.class_labels[predict_arrays(data, self.arrays)]
@@ -1,18 +1,63 @@
 # coding=utf-8
 import copy
-import random
+import cPickle
+import multiprocessing as mp
+import os
+import Queue
+import traceback
 import warnings
 from datetime import datetime as dt
 
 from device import AvailableDevice
+from ensemble import PopulationVote
 from graphical_model import *
 from individual import Individual
 from treelib.individual import DecisionTree
-from utils import MetaDataset, DatabaseHandler
+from utils import MetaDataset, DatabaseHandler, spawn_random_states
 
 __author__ = 'Henry Cagnini'
 
 
+def __sample_individual__(args):
+    """
+    Worker function for Ardennes.sample_population. Samples an individual and returns its compact encoding
+    (see DecisionTree.encode), so that no tree objects are transferred between processes.
+    """
+
+    func, gm, ind_id, iteration, labels, seed, train_rows, cutoff = args
+
+    if isinstance(gm, str):  # a snapshot of the model, pickled by the parent process (see Ardennes.__steady_state__)
+        gm = cPickle.loads(gm)
+
+    # training rows may have been subsampled by the parent process since this worker was forked
+    if not np.array_equal(train_rows, DecisionTree.arg_sets['train']):
+        DecisionTree.set_train_rows(train_rows)
+
+    # likewise for the height cap of a curriculum, which travels with the model
+    DecisionTree.max_height = gm.D
+
+    ind = func(
+        ind_id=ind_id, gm=gm, iteration=iteration, labels=labels, random_state=np.random.RandomState(seed),
+        cutoff=cutoff
+    )
+    return ind.encode()
+
+
+def __try_sample_individual__(args):
+    """
+    Worker function for Ardennes.__steady_state__. pool.apply_async has no error callback in Python 2, so
+    exceptions are returned, formatted, instead of being raised (and lost) in the worker.
+
+    :rtype: tuple
+    :return: A tuple with the encoding of the individual (None on failure) and the traceback (None on success).
+    """
+
+    try:
+        return __sample_individual__(args), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
 class Ardennes(object):
     val_str = 'val_df'
     train_str = 'train_df'
@@ -27,6 +72,28 @@ class Ardennes(object):
 
         self.trained = False
         self.predictor = None
+        self.population = None
+        self.gm = None  # graphical model at the end of fit
+        self.random_state = None  # type: np.random.RandomState
+        self.history = []  # best fitness of each generation
+
+        # resources spent by fit, checked against budgets
+        self.elapsed_time = 0.  # in seconds
+        self.n_evaluations = 0  # individuals evaluated
+        self.n_split_evaluations = 0  # candidate thresholds evaluated
+        self._generation_cost = None  # type: dict
+        self.throughput = None  # individuals evaluated per second
+
+        # progressive subsampling of the training set
+        self._train_rows = None  # type: np.ndarray  # all training rows
+        self._subsample_order = None  # type: np.ndarray  # order in which training rows join the subsample
+        self._subsample_fraction = None  # type: float
+
+        # height curriculum
+        self._height_cap = None  # type: int  # current maximum depth of trees
+        self._cap_start = 0  # first generation with the current cap
+        self._cap_costs = []  # cost of each generation with the current cap
+        self._expected_cost = None  # type: dict  # expected cost of a generation with the current cap
 
     @staticmethod
     def __initialize_argsets__(full, train, val, test):
@@ -66,8 +133,9 @@ class Ardennes(object):
         else:
             dbhandler = None
 
-        random.seed(random_state)
-        np.random.seed(random_state)
+        # every stochastic component draws from its own stream, derived from random_state; global states are
+        # never seeded, so that several instances (or workers) do not interfere with each other
+        self.random_state, gm_random_state = spawn_random_states(random_state, 2)
 
         full = copy.deepcopy(train_set)
 
@@ -111,14 +179,21 @@ class Ardennes(object):
             n_classes=len(full[full.columns[-1]].unique())
         )]
 
-        if dbhandler is not None:
+        # a database to which an interrupted evolution was logging already holds its sets and classes
+        resuming = 'resume_from' in kwargs and kwargs['resume_from'] is not None and \
+            dbhandler is not None and dbhandler.has_run()
+
+        if dbhandler is not None and not resuming:
             dbhandler.write_sets(metadatas)
 
         arg_sets = self.__initialize_argsets__(full, train_set, val_set, test_set)
 
         dataset_info = MetaDataset(full)
 
-        mdevice = AvailableDevice(full, dataset_info)
+        if dbhandler is not None and not resuming:
+            dbhandler.write_classes(dataset_info.class_labels)
+
+        mdevice = AvailableDevice(full, dataset_info, arg_sets=arg_sets)
 
         DecisionTree.set_values(
             arg_sets=arg_sets,
@@ -133,10 +208,14 @@ class Ardennes(object):
             multi_tests=kwargs['multi_tests']
         )
 
-        gm = GraphicalModel(
+        # sparse models only store labels in use, which pays off for datasets with thousands of attributes
+        gm_class = SparseGraphicalModel if 'sparse_model' in kwargs and kwargs['sparse_model'] else GraphicalModel
+
+        gm = gm_class(
             D=self.D,
             dataset_info=dataset_info,
-            multi_tests=kwargs['multi_tests']
+            multi_tests=kwargs['multi_tests'],
+            random_state=gm_random_state
         )
 
         return gm
@@ -144,85 +223,696 @@ class Ardennes(object):
     def fit(self, train_df, decile, verbose=True, **kwargs):
         """
         Fits the algorithm to the provided data.
+
+        Optional keyword arguments include val_df, test_df, multi_tests, random_state, dbhandler,
+        sparse_model (whether to use a SparseGraphicalModel; defaults to False), n_jobs (number of processes
+        which sample individuals; -1 uses all cores; defaults to 1), checkpoint_path (file where the state of the
+        evolution is periodically written; defaults to None, i.e. no checkpoints), checkpoint_every (number of
+        generations between checkpoints; defaults to 10) and resume_from (a checkpoint file from a previous
+        call to fit, with the same data, from which the evolution continues). When resuming, dbhandler may be the
+        database to which the interrupted evolution was logging (see DatabaseHandler.resume).
+
+        Besides stopping when every individual is equal, the evolution may also stop when the normalized entropy
+        of the model drops below min_entropy; when the best fitness does not improve for patience generations;
+        or when the fraction of individuals whose structure duplicates another one exceeds max_duplicates.
+        These criteria are optional keyword arguments, and are disabled by default.
+
+        Budgets may be set with time_budget (in seconds), evaluation_budget (number of individuals evaluated)
+        and split_budget (number of candidate thresholds evaluated). The evolution stops before a generation that
+        would exceed any of them, based on the cost of the previous generation; the best individual found so far
+        is kept as predictor.
+
+        If subsample (a fraction in (0, 1]) is provided, trees are grown and scored on a stratified subsample of
+        the training set, starting with that fraction of the rows. The subsample doubles whenever the convergence
+        of the evolution (either the fraction of iterations done or one minus the entropy of the model) calls
+        for a larger one, until it comprises the whole training set; surviving individuals are scored again on
+        each new subsample. The final population is always scored on the whole training set.
+
+        If steady_state is True, the evolution is asynchronous: individuals are sampled continuously (by the
+        n_jobs processes), and each one replaces the worst individual of the population as soon as it arrives,
+        provided it is not worse. The model is refreshed with the current fittest individuals every
+        refresh_every arrivals (defaults to the number of individuals replaced per generation), and each refresh
+        counts as an iteration (also for migrations, see treelib.islands). Steady-state evolution may not be used
+        with subsample or checkpoints.
+
+        If warm_start is provided, the evolution starts from the state of a previous call to fit on related data
+        (e.g. another fold of the same dataset), either as returned by Ardennes.warm_start_state or as a file
+        written by Ardennes.save_warm_start. Its graphical model replaces the initial one, and its individuals are
+        scored again on the current training rows and join the first generation, which is sampled from that
+        model; either may be missing.
+
+        If curriculum (an initial maximum height, smaller than the one of this instance) is provided, trees are
+        first grown with that height, which is cheaper to construct and evaluate. The height grows by one
+        whenever the best fitness does not improve for curriculum_patience (defaults to 2) generations, or every
+        individual is equal, until it reaches the maximum height of this instance; the model grows along. Other
+        convergence criteria (min_entropy, patience and max_duplicates) only apply at the maximum height.
+
+        If race is True, sampled individuals are scored in blocks of race_block_size (defaults to 1000) training
+        rows, and discarded as soon as their fitness provably (with probability 1 - race_delta, which defaults
+        to 0.05) cannot reach the fittest individuals which survive from the previous generation; only the
+        others are scored on every row and partition. See Device.race.
         """
 
         assert 1 <= int(self.n_individuals * decile) <= self.n_individuals, \
             ValueError('Decile must comprise at least one individual and at maximum the whole population!')
 
+        t0 = dt.now()  # time spent in setup also counts towards the time budget
+
         gm = self.__setup__(train_set=train_df, **kwargs)
 
-        sample_func = np.vectorize(Individual, excluded=['gm', 'iteration'])
+        sample_func = Individual
+
+        n_jobs = kwargs['n_jobs'] if 'n_jobs' in kwargs and kwargs['n_jobs'] is not None else 1
+        if n_jobs == -1:
+            n_jobs = mp.cpu_count()
+
+        race = kwargs['race'] if 'race' in kwargs else False
+        if race:
+            DecisionTree.set_values(
+                race_block_size=kwargs['race_block_size'] if 'race_block_size' in kwargs else 1000,
+                race_delta=kwargs['race_delta'] if 'race_delta' in kwargs else 0.05
+            )
+            # training rows are raced in random order, so that every block is a random sample of them
+            DecisionTree.mdevice.set_race_order(self.random_state.permutation(DecisionTree.dataset.shape[0]))
+
+        # workers are forked once, after setup, so that they share the dataset (and device) with this process;
+        # only the graphical model is sent to them at each generation
+        pool = mp.Pool(n_jobs) if n_jobs > 1 else None
+
+        checkpoint_path = kwargs['checkpoint_path'] if 'checkpoint_path' in kwargs else None
+        checkpoint_every = kwargs['checkpoint_every'] if 'checkpoint_every' in kwargs else 10
 
         population = np.empty(shape=self.n_individuals, dtype=Individual)
+        scores = np.zeros(shape=self.n_individuals, dtype=Individual.score_dtype)
         to_replace_index = np.arange(self.n_individuals, dtype=np.int32)
 
         '''
         Main loop
         '''
         iteration = 0
+        self.history = []
+        self.elapsed_time, self.n_evaluations, self.n_split_evaluations, self.throughput = 0., 0, 0, None
+        self._train_rows, self._subsample_order, self._subsample_fraction = None, None, None
+        self._height_cap, self._cap_start, self._cap_costs, self._expected_cost = None, 0, [], None
+
+        if 'resume_from' in kwargs and kwargs['resume_from'] is not None:
+            gm, population, scores, to_replace_index, iteration = self.__read_checkpoint__(
+                kwargs['resume_from'], sample_func
+            )
+            if 'dbhandler' in kwargs and kwargs['dbhandler'] is not None:
+                kwargs['dbhandler'].resume(iteration)
+
+        subsample = kwargs['subsample'] if 'subsample' in kwargs else None
+        if subsample is not None:
+            assert 0. < subsample <= 1., ValueError('subsample must be a fraction in (0, 1]!')
+            self.__init_subsample__(subsample)
+
+        # elites are scored on the initial subsample, if any
+        if 'warm_start' in kwargs and kwargs['warm_start'] is not None:
+            assert 'resume_from' not in kwargs or kwargs['resume_from'] is None, \
+                ValueError('warm_start may not be used with resume_from!')
+            gm, population, scores, to_replace_index = self.__warm_start__(kwargs['warm_start'], gm, sample_func)
+
+        curriculum = kwargs['curriculum'] if 'curriculum' in kwargs else None
+        if curriculum is not None and self._height_cap is None:  # otherwise, it was read from a checkpoint
+            assert 1 <= curriculum <= self.D + 1, ValueError('curriculum must be a height in [1, max_height]!')
+            self._height_cap = curriculum - 1
+        if self._height_cap is not None:
+            self.__set_height_cap__(gm, self._height_cap)
+
+        steady_state = kwargs['steady_state'] if 'steady_state' in kwargs else False
+        if steady_state:
+            assert subsample is None and checkpoint_path is None and \
+                ('resume_from' not in kwargs or kwargs['resume_from'] is None), \
+                ValueError('steady_state may not be used with subsample, checkpoint_path or resume_from!')
+
+        self.elapsed_time += (dt.now() - t0).total_seconds()
+
+        if steady_state:
+            scores, population = self.__steady_state__(
+                gm, decile, sample_func, population, scores, self.n_individuals - len(to_replace_index),
+                pool, n_jobs, verbose, **kwargs
+            )
+        else:
+            while iteration < self.n_iterations:
+                t1 = dt.now()  # starts measuring time
 
-        while iteration < self.n_iterations:
-            t1 = dt.now()  # starts measuring time
+                if subsample is not None:
+                    scores = self.__grow_subsample__(subsample, gm, iteration, population, scores, to_replace_index)
 
-            fitness, population = self.sample_population(gm, iteration, sample_func, to_replace_index, population)
+                # individuals must be able to reach the fitness of the worst survivor in order to be fully scored
+                survivors = np.setdiff1d(np.arange(self.n_individuals), to_replace_index)
+                cutoff = scores['fitness'][survivors].min() - Individual.rtol if race and len(survivors) > 0 else None
 
-            to_replace_index, fittest_pop = self.split_population(decile, population)
+                scores, population = self.sample_population(
+                    gm, iteration, sample_func, to_replace_index, population, scores, pool=pool, n_jobs=n_jobs,
+                    cutoff=cutoff
+                )
 
-            # TODO use only when in mtst!
-            # warnings.warn('WARNING: testing new ideas!')
-            # best_individual = self.get_best_individual(population)
-            # DecisionTree.max_height = best_individual.height
-            # warnings.warn('WARNING: testing new ideas!')
+                sampled = [ind for ind in population if ind.iteration == iteration]
+                self._generation_cost = dict(
+                    n_evaluations=len(sampled),
+                    n_split_evaluations=sum([ind.n_split_evaluations for ind in sampled]),
+                    n_raced_out=sum([ind.raced_out for ind in sampled])
+                )
+                self.n_evaluations += self._generation_cost['n_evaluations']
+                self.n_split_evaluations += self._generation_cost['n_split_evaluations']
 
-            gm.update(fittest_pop)
+                scores, population = self.__migrate__(iteration, gm, population, scores)
 
-            t2 = dt.now()
-            self.__report__(
-                iteration=iteration,
-                population=population,
-                fitness=fitness,
-                verbose=verbose,
-                elapsed_time=(t2 - t1).total_seconds(),
-                gm=gm,
-                **kwargs
-            )
+                to_replace_index, fittest_pop = self.split_population(decile, population)
+
+                gm.update(fittest_pop)
+
+                self.history += [float(scores['fitness'][0])]
+
+                self._generation_cost['elapsed_time'] = (dt.now() - t1).total_seconds()
+                self.elapsed_time += self._generation_cost['elapsed_time']
+                self.throughput = self.n_evaluations / self.elapsed_time
+
+                if self._height_cap is not None:
+                    self.__curriculum__(gm, scores, **kwargs)
+
+                stop_criteria = self.__early_stop__(population, scores, gm, **kwargs)
+
+                t2 = dt.now()
+                self.__report__(
+                    iteration=iteration,
+                    population=population,
+                    scores=scores,
+                    verbose=verbose,
+                    elapsed_time=(t2 - t1).total_seconds(),
+                    gm=gm,
+                    stop_criteria=stop_criteria,
+                    throughput=self.throughput,
+                    **kwargs
+                )
 
-            if self.__early_stop__(population):
-                break
+                if checkpoint_path is not None and (iteration + 1) % checkpoint_every == 0:
+                    self.__write_checkpoint__(checkpoint_path, gm, population, scores, to_replace_index, iteration)
 
-            iteration += 1
+                if len(stop_criteria) > 0:
+                    break
 
-        self.predictor = self.get_best_individual(population)
+                iteration += 1
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if subsample is not None and self._subsample_fraction < 1.:  # scores the final population on all rows
+            self._subsample_fraction = 1.
+            DecisionTree.set_train_rows(self._train_rows)
+            for ind in population:
+                ind.score()
+
+            scores = Individual.scores_of(population)
+            order = Individual.rank(scores)
+            scores, population = scores[order], population[order]
+
+        self.predictor = self.get_best_individual(population, scores)
+        self.population = population  # sorted from best to worst individual
+        self.gm = gm
         self.trained = True
 
+    def warm_start_state(self, n_elites=None):
+        """
+        Gathers the state from which another call to fit, on related data, may start. See Ardennes.fit.
+
+        :type n_elites: int
+        :param n_elites: optional - number of individuals to keep, from best to worst. Defaults to the whole
+            final population.
+        :rtype: dict
+        :return: A dictionary with the final graphical model, the encodings of the best individuals (see
+            DecisionTree.encode), and the attributes and class labels they refer to.
+        """
+
+        assert self.trained, ValueError('Ardennes must be fitted before its state is used for a warm start!')
+
+        n_elites = self.n_individuals if n_elites is None else n_elites
+
+        return dict(
+            gm=self.gm,
+            population=[ind.encode() for ind in self.population[:n_elites]],
+            pred_attr=list(DecisionTree.dataset_info.pred_attr),
+            class_labels=list(DecisionTree.dataset_info.class_labels)
+        )
+
+    def save_warm_start(self, path, n_elites=None):
+        """
+        Writes the state returned by Ardennes.warm_start_state to a binary file.
+
+        :type path: str
+        :param path: Path to the file.
+        :type n_elites: int
+        :param n_elites: optional - number of individuals to keep, from best to worst.
+        """
+
+        with open(path, 'wb') as f:
+            cPickle.dump(self.warm_start_state(n_elites), f, protocol=cPickle.HIGHEST_PROTOCOL)
+
+    def __warm_start__(self, warm_start, gm, func):
+        """
+        Sets up the initial state of the evolution from the state of a previous call to fit.
+
+        :param warm_start: Either a dictionary returned by Ardennes.warm_start_state, or a path to a file written
+            by Ardennes.save_warm_start. Keys gm and population are both optional.
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Graphical model created for the current data. Its random generator is kept.
+        :param func: Sample function. See Ardennes.sample_population.
+        :rtype: tuple
+        :return: A tuple with the graphical model, the population, its scores and the indexes of individuals
+            yet to be sampled.
+        """
+
+        if isinstance(warm_start, basestring):
+            with open(warm_start, 'rb') as f:
+                warm_start = cPickle.load(f)
+
+        dataset_info = DecisionTree.dataset_info
+
+        assert list(warm_start['pred_attr']) == list(dataset_info.pred_attr) and \
+            list(warm_start['class_labels']) == list(dataset_info.class_labels), \
+            ValueError('warm_start refers to other attributes or class labels than the current dataset!')
+
+        if 'gm' in warm_start and warm_start['gm'] is not None:
+            warm_gm = warm_start['gm']  # type: GraphicalModel
+
+            assert type(warm_gm) is type(gm) and warm_gm.multi_tests == gm.multi_tests, \
+                ValueError('warm_start model has another type or number of tests than the current one!')
+
+            # the model of a previous fit is never changed; draws still come from the current random generator
+            warm_gm = copy.deepcopy(warm_gm)
+            warm_gm.dataset_info, warm_gm.random_state = dataset_info, gm.random_state
+            warm_gm.set_depth(gm.D)
+            gm = warm_gm
+
+        encodings = warm_start['population'] if 'population' in warm_start else None
+        encodings = [] if encodings is None else encodings[:self.n_individuals]
+
+        population = np.empty(shape=self.n_individuals, dtype=Individual)
+        scores = np.zeros(shape=self.n_individuals, dtype=Individual.score_dtype)
+
+        # elites are evaluated on the current training rows; their trees, thresholds included, are kept
+        for i, encoding in enumerate(encodings):
+            population[i] = func(ind_id=i, gm=None, iteration=-1, encoding=encoding)
+            population[i].score()
+
+        n_elites = len(encodings)
+        scores[:n_elites] = Individual.scores_of(population[:n_elites])
+        self.n_evaluations += n_elites
+
+        return gm, population, scores, np.arange(n_elites, self.n_individuals, dtype=np.int32)
+
+    def __steady_state__(self, gm, decile, func, population, scores, n_filled, pool, n_processes, verbose, **kwargs):
+        """
+        Asynchronous (steady-state) counterpart of the main loop of Ardennes.fit. Workers are kept busy with
+        more tasks than processes, so that slow individuals do not stall the others.
+
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Graphical model, updated in place.
+        :type decile: float
+        :param decile: Fraction of the population which is used to refresh the model.
+        :param func: Sample function. See Ardennes.sample_population.
+        :type population: numpy.ndarray
+        :param population: Initial population, of which only the first n_filled individuals are set.
+        :type scores: numpy.ndarray
+        :param scores: Scores of the initial population.
+        :type n_filled: int
+        :param n_filled: Number of individuals already in the population (e.g. from a warm start).
+        :type pool: multiprocessing.Pool
+        :param pool: optional - pool of worker processes. If None, individuals are sampled by this process.
+        :type n_processes: int
+        :param n_processes: Number of processes in pool.
+        :type verbose: bool
+        :param verbose: Whether to print a report after each refresh of the model.
+        :rtype: tuple
+        :return: A tuple where the first item is the scores of the population and the second the population,
+            both sorted from best to worst individual.
+        """
+
+        integer_decile = int(self.n_individuals * decile)
+
+        refresh_every = kwargs['refresh_every'] if 'refresh_every' in kwargs and kwargs['refresh_every'] is not None \
+            else max(1, self.n_individuals - integer_decile)
+        assert refresh_every > 0, ValueError('refresh_every must be a positive integer!')
+
+        race = kwargs['race'] if 'race' in kwargs else False
+
+        # (iteration, encoding, traceback) tuples are put here, in order of arrival, by the callbacks of the pool
+        arrivals = Queue.Queue()
+
+        # tasks are pickled by the pool in another thread, possibly after the model is refreshed; hence, they
+        # carry a snapshot of the model, taken at each refresh, from which their labels are drawn
+        snapshot = [None]
+
+        def take_snapshot():
+            if pool is not None:
+                snapshot[0] = cPickle.dumps(gm, cPickle.HIGHEST_PROTOCOL)
+
+        def submit(iteration):
+            labels = gm.sample(1)[0]
+            seed = gm.random_state.randint(0, 2 ** 32, dtype=np.uint64)
+            # newcomers must be able to reach the fitness of the worst individual in order to be fully scored
+            cutoff = scores['fitness'][-1] - Individual.rtol if race and n_filled == self.n_individuals else None
+
+            if pool is None:
+                # ids are set on arrival, according to the position which the individual takes in the population
+                task = (func, gm, -1, iteration, labels, seed, DecisionTree.arg_sets['train'], cutoff)
+                arrivals.put((iteration, __sample_individual__(task), None))
+            else:
+                task = (func, snapshot[0], -1, iteration, labels, seed, DecisionTree.arg_sets['train'], cutoff)
+                pool.apply_async(
+                    __try_sample_individual__, (task,),
+                    callback=lambda result: arrivals.put((iteration, ) + tuple(result))
+                )
+
+        take_snapshot()
+
+        iteration = 0
+
+        # two tasks per process, so that a process never waits for the next one
+        for _ in xrange(2 * n_processes if pool is not None else 1):
+            submit(iteration)
+
+        t1 = dt.now()
+        n_evaluations, n_split_evaluations, n_raced_out = 0, 0, 0
+
+        while True:
+            sampled_at, encoding, error = arrivals.get()
+            if error is not None:
+                raise RuntimeError('A worker process failed to sample an individual:\n%s' % error)
+
+            ind = func(ind_id=-1, gm=None, iteration=sampled_at, encoding=encoding)
+            n_evaluations += 1
+            n_split_evaluations += ind.n_split_evaluations
+            n_raced_out += ind.raced_out
+
+            if n_filled < self.n_individuals:  # initial population
+                ind.ind_id = n_filled
+                population[n_filled], scores[n_filled] = ind, Individual.scores_of([ind])[0]
+                n_filled += 1
+            else:
+                candidate = Individual.scores_of([ind])
+                # the newcomer replaces the worst individual if it is not worse (ties favor the newcomer)
+                if Individual.rank(np.hstack((scores[-1:], candidate)))[0] == 1:
+                    ind.ind_id = population[-1].ind_id
+                    population[-1], scores[-1] = ind, candidate[0]
+
+            if n_filled == self.n_individuals:
+                order = Individual.rank(scores)
+                scores, population = scores[order], population[order]
+
+            if n_filled == self.n_individuals and (n_evaluations >= refresh_every or iteration == 0):
+                # each refresh of the model counts as a generation, also for migrations between islands
+                scores, population = self.__migrate__(iteration, gm, population, scores)
+
+                gm.update(population[:integer_decile])
+
+                self.history += [float(scores['fitness'][0])]
+
+                t2 = dt.now()
+                self._generation_cost = dict(
+                    n_evaluations=n_evaluations,
+                    n_split_evaluations=n_split_evaluations,
+                    n_raced_out=n_raced_out,
+                    elapsed_time=(t2 - t1).total_seconds()
+                )
+                self.n_evaluations += n_evaluations
+                self.n_split_evaluations += n_split_evaluations
+                self.elapsed_time += self._generation_cost['elapsed_time']
+                self.throughput = self.n_evaluations / self.elapsed_time
+
+                if self._height_cap is not None:
+                    self.__curriculum__(gm, scores, **kwargs)
+
+                stop_criteria = self.__early_stop__(population, scores, gm, **kwargs)
+
+                self.__report__(
+                    iteration=iteration,
+                    population=population,
+                    scores=scores,
+                    verbose=verbose,
+                    elapsed_time=self._generation_cost['elapsed_time'],
+                    gm=gm,
+                    stop_criteria=stop_criteria,
+                    throughput=self.throughput,
+                    **kwargs
+                )
+
+                iteration += 1
+                if len(stop_criteria) > 0 or iteration >= self.n_iterations:
+                    break
+
+                take_snapshot()  # the model was refreshed (and, with a curriculum, possibly deepened)
+
+                t1 = dt.now()
+                n_evaluations, n_split_evaluations, n_raced_out = 0, 0, 0
+
+            submit(iteration)
+
+        return scores, population
+
+    def __migrate__(self, iteration, gm, population, scores):
+        """
+        Exchanges individuals with other populations, after each generation is sampled and ranked. Does nothing
+        by default; see treelib.islands.Island.
+
+        :type iteration: int
+        :param iteration: Current iteration.
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Current graphical model.
+        :type population: numpy.ndarray
+        :param population: Current population, sorted from best to worst individual.
+        :type scores: numpy.ndarray
+        :param scores: Scores of the current population.
+        :rtype: tuple
+        :return: A tuple with the scores and the population, both sorted from best to worst individual.
+        """
+
+        return scores, population
+
+    def __write_checkpoint__(self, path, gm, population, scores, to_replace_index, iteration):
+        """
+        Writes the state of the evolution to a single binary file. The file is first written to a temporary
+        path and then renamed, so that a crash while writing never corrupts the previous checkpoint.
+
+        :type path: str
+        :param path: Path to the checkpoint file.
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Current graphical model, along with its random generator.
+        :type population: numpy.ndarray
+        :param population: Current population, stored as compact encodings (see DecisionTree.encode).
+        :type scores: numpy.ndarray
+        :param scores: Scores of the current population.
+        :param to_replace_index: Indexes of individuals to be replaced in the following generation.
+        :type iteration: int
+        :param iteration: Last iteration completed.
+        """
+
+        state = dict(
+            n_individuals=self.n_individuals,
+            D=self.D,
+            iteration=iteration,
+            random_state=self.random_state,
+            history=self.history,
+            elapsed_time=self.elapsed_time,
+            n_evaluations=self.n_evaluations,
+            n_split_evaluations=self.n_split_evaluations,
+            train_rows=self._train_rows,
+            subsample_order=self._subsample_order,
+            subsample_fraction=self._subsample_fraction,
+            height_cap=self._height_cap,
+            cap_start=self._cap_start,
+            cap_costs=self._cap_costs,
+            expected_cost=self._expected_cost,
+            gm=gm,
+            ind_ids=[ind.ind_id for ind in population],
+            ind_iterations=[ind.iteration for ind in population],
+            encodings=[ind.encode() for ind in population],
+            scores=scores,
+            to_replace_index=to_replace_index
+        )
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(tmp_path, path)  # atomic on POSIX systems
+
+    def __read_checkpoint__(self, path, func):
+        """
+        Reads the state of the evolution from a checkpoint file written by __write_checkpoint__.
+
+        :type path: str
+        :param path: Path to the checkpoint file.
+        :param func: Sample function, used for rebuilding individuals from their encodings.
+        :rtype: tuple
+        :return: A tuple with the graphical model, population, scores, indexes of individuals to be replaced
+            and the iteration from which the evolution continues.
+        """
+
+        with open(path, 'rb') as f:
+            state = cPickle.load(f)
+
+        assert state['n_individuals'] == self.n_individuals and state['D'] == self.D, \
+            ValueError('Checkpoint was written by an instance with a different configuration!')
+
+        self.random_state = state['random_state']
+        self.history = state['history']
+        self.elapsed_time = state['elapsed_time']
+        self.n_evaluations = state['n_evaluations']
+        self.n_split_evaluations = state['n_split_evaluations']
+        self._train_rows = state['train_rows']
+        self._subsample_order = state['subsample_order']
+        self._subsample_fraction = state['subsample_fraction']
+        self._height_cap = state['height_cap']
+        self._cap_start = state['cap_start']
+        self._cap_costs = state['cap_costs']
+        self._expected_cost = state['expected_cost']
+
+        population = np.empty(shape=self.n_individuals, dtype=Individual)
+        for i, (ind_id, ind_iteration, encoding) in enumerate(
+                zip(state['ind_ids'], state['ind_iterations'], state['encodings'])):
+            population[i] = func(ind_id=ind_id, gm=None, iteration=ind_iteration, encoding=encoding)
+
+        return state['gm'], population, state['scores'], state['to_replace_index'], state['iteration'] + 1
+
+    def __init_subsample__(self, subsample):
+        """
+        Sets up progressive subsampling of the training set. Training rows are put in an order such that each
+        class is represented, at every prefix of the order, in the same proportion as in the training set.
+
+        :type subsample: float
+        :param subsample: Initial fraction of the training set.
+        """
+
+        if self._subsample_order is None:  # otherwise, it was read from a checkpoint
+            self._train_rows = DecisionTree.arg_sets['train']
+            self._subsample_fraction = subsample
+
+            rows = np.flatnonzero(self._train_rows)
+            classes = DecisionTree.dataset[DecisionTree.dataset_info.target_attr].values[rows]
+
+            # position of each row within its class, relative to the size of the class, in random order
+            rank = np.empty(rows.shape[0], dtype=np.float64)
+            for label in np.unique(classes):
+                in_class = np.flatnonzero(classes == label)
+                rank[self.random_state.permutation(in_class)] = np.arange(in_class.shape[0]) / float(in_class.shape[0])
+
+            self._subsample_order = rows[np.lexsort((self.random_state.random_sample(rows.shape[0]), rank))]
+
+        DecisionTree.set_train_rows(self.__subsample_rows__())
+
+    def __subsample_rows__(self):
+        """
+        :rtype: numpy.ndarray
+        :return: A boolean mask over the rows of the dataset, with the rows in the current subsample.
+        """
+
+        n_rows = int(np.ceil(self._subsample_fraction * self._subsample_order.shape[0]))
+
+        train_rows = np.zeros(self._train_rows.shape[0], dtype=np.bool)
+        train_rows[self._subsample_order[:n_rows]] = True
+        return train_rows
+
+    def __grow_subsample__(self, subsample, gm, iteration, population, scores, to_replace_index):
+        """
+        Grows the subsample of the training set, if the convergence of the evolution calls for it. Surviving
+        individuals are then scored again, so that they can be compared to the ones sampled next.
+
+        :type subsample: float
+        :param subsample: Initial fraction of the training set.
+        :rtype: numpy.ndarray
+        :return: Scores of the population.
+        """
+
+        progress = max(iteration / float(self.n_iterations), 1. - gm.entropy())
+        target = subsample + (1. - subsample) * progress
+
+        fraction = self._subsample_fraction
+        while fraction < target:
+            fraction = min(1., 2. * fraction)
+
+        if fraction > self._subsample_fraction:
+            self._subsample_fraction = fraction
+            DecisionTree.set_train_rows(self.__subsample_rows__())
+
+            # in the first iteration, only individuals from a warm start survive
+            survivors = np.setdiff1d(np.arange(self.n_individuals), to_replace_index)
+            for i in survivors:
+                population[i].score()
+            scores[survivors] = Individual.scores_of(population[survivors])
+
+        return scores
+
     @staticmethod
-    def sample_population(gm, iteration, func, to_replace_index, population):
+    def sample_population(gm, iteration, func, to_replace_index, population, scores, pool=None, n_jobs=1,
+                          cutoff=None):
         """
 
         :type gm: treelib.graphical_model.GraphicalModel
         :param gm: Current graphical model.
         :type iteration: int
         :param iteration: Current iteration.
-        :param func: Sample function.
+        :param func: Sample function. Receives the graphical model, individual id, iteration, drawn labels and
+            a random generator, or an encoding of an individual already sampled.
         :type to_replace_index: list
         :param to_replace_index: List of indexes of individuals to be replaced in the following generation.
         :type population: numpy.ndarray
         :param population: Current population.
+        :type scores: numpy.ndarray
+        :param scores: Scores of the current population, as returned by Individual.scores_of.
+        :type pool: multiprocessing.Pool
+        :param pool: optional - pool of worker processes which sample individuals. If None, individuals are
+            sampled by this process. Results are the same either way.
+        :type n_jobs: int
+        :param n_jobs: optional - number of processes in pool.
+        :type cutoff: float
+        :param cutoff: optional - fitness that sampled individuals must be able to reach in order to be scored on
+            every row. See DecisionTree.score.
         :rtype: tuple
-        :return: A tuple where the first item is the population fitness and the second the population.
+        :return: A tuple where the first item is the scores of the population and the second the population,
+            both sorted from best to worst individual.
         """
 
-        population.flat[to_replace_index] = func(
-            ind_id=[population[i].ind_id for i in to_replace_index] if iteration > 0 else to_replace_index,
-            gm=gm,
-            iteration=iteration
-        )
-        population.sort()  # sorts using quicksort, worst individual to best
-        population = population[::-1]  # reverses list so the best individual is in the beginning
+        ind_ids = [population[i].ind_id for i in to_replace_index] if iteration > 0 else to_replace_index
+
+        # draws every label needed by this generation at once, plus one seed per individual for labels
+        # of non-materialized nodes; hence, results do not depend on which process samples each individual
+        labels = gm.sample(len(ind_ids))
+        seeds = gm.random_state.randint(0, 2 ** 32, size=len(ind_ids), dtype=np.uint64)
+
+        sampled = np.empty(len(ind_ids), dtype=Individual)
+        if pool is None:
+            for j, ind_id in enumerate(ind_ids):
+                sampled[j] = func(
+                    ind_id=ind_id, gm=gm, iteration=iteration, labels=labels[j],
+                    random_state=np.random.RandomState(seeds[j]), cutoff=cutoff
+                )
+        else:
+            train_rows = DecisionTree.arg_sets['train']
+            tasks = [
+                (func, gm, ind_id, iteration, labels[j], seeds[j], train_rows, cutoff)
+                for j, ind_id in enumerate(ind_ids)
+            ]
 
-        fitness = np.array([x.fitness for x in population])
+            # one chunk per process, so that the model is sent only once to each process
+            chunk_size = int(np.ceil(len(tasks) / float(n_jobs)))
+            encodings = pool.map(__sample_individual__, tasks, chunksize=max(1, chunk_size))
 
-        return fitness, population
+            for j, encoding in enumerate(encodings):
+                sampled[j] = func(ind_id=ind_ids[j], gm=None, iteration=iteration, encoding=encoding)
+
+        population.flat[to_replace_index] = sampled
+        scores[to_replace_index] = Individual.scores_of(sampled)
+
+        # ranks by scores only; individuals are merely permuted, so that the best one is in the beginning
+        order = Individual.rank(scores)
+
+        return scores[order], population[order]
 
     def split_population(self, decile, population):
         integer_decile = int(self.n_individuals * decile)
@@ -234,9 +924,10 @@ class Ardennes(object):
         return to_replace_index, fittest_pop
 
     @staticmethod
-    def get_best_individual(population):
-        outer_fitness = [0.5 * (ind.train_acc_score + ind.val_acc_score) for ind in population]
-        return population[np.argmax(outer_fitness)]
+    def get_best_individual(population, scores=None):
+        if scores is None:
+            scores = Individual.scores_of(population)
+        return population[np.argmax(scores['outer_fitness'])]
 
     @property
     def tree_height(self):
@@ -249,10 +940,12 @@ class Ardennes(object):
         population = kwargs['population']
         verbose = kwargs['verbose']
         elapsed_time = kwargs['elapsed_time']
-        fitness = kwargs['fitness']
+        scores = kwargs['scores']
+        fitness = scores['fitness']
         gm = kwargs['gm']
+        stop_criteria = kwargs['stop_criteria'] if 'stop_criteria' in kwargs else []
 
-        best_individual = self.get_best_individual(population)
+        best_individual = self.get_best_individual(population, scores)
 
         # optional data
         dbhandler = None if 'dbhandler' not in kwargs else kwargs['dbhandler']  # type: utils.DatabaseHandler
@@ -265,14 +958,232 @@ class Ardennes(object):
                 iteration, mean, median, best_individual.fitness, elapsed_time, best_individual.height, best_individual.n_nodes
             ) + ('test acc: %0.6f' % best_individual.test_acc_score if best_individual.test_acc_score is not None else '')
 
+            budgets = [
+                ('%0.2f' % self.elapsed_time, 'time_budget', 'sec'),
+                ('%d' % self.n_evaluations, 'evaluation_budget', ' evaluations'),
+                ('%d' % self.n_split_evaluations, 'split_budget', ' split evaluations')
+            ]
+            # only reported when a budget is set, so that the default output is unchanged
+            if any([name in kwargs and kwargs[name] is not None for spent, name, unit in budgets]):
+                print 'spent: ' + '  '.join([
+                    spent + ('/%s' % kwargs[name] if name in kwargs and kwargs[name] is not None else '') + unit
+                    for spent, name, unit in budgets
+                ])
+
+            if 'throughput' in kwargs and kwargs['throughput'] is not None:
+                print 'throughput: %0.2f individuals/sec' % kwargs['throughput']
+
+            if 'race' in kwargs and kwargs['race']:
+                print 'racing: %d/%d individuals discarded' % (
+                    self._generation_cost['n_raced_out'], self._generation_cost['n_evaluations']
+                )
+
+            if self._height_cap is not None:
+                print 'height cap: %d/%d  expected cost per generation: %0.2fsec  %d split evaluations' % (
+                    self._height_cap + 1, self.D + 1,
+                    self._expected_cost['elapsed_time'], self._expected_cost['n_split_evaluations']
+                )
+
+            if self._subsample_fraction is not None:
+                print 'training rows: %d/%d' % (DecisionTree.y_train_true.shape[0], np.count_nonzero(self._train_rows))
+
+            if dbhandler is not None and dbhandler.n_dropped > 0:
+                print 'logging: %d generations dropped by the background writer' % dbhandler.n_dropped
+
+            for criterion in stop_criteria:
+                print 'stopping: %s' % criterion
+
         if dbhandler is not None:
-            dbhandler.write_prototype(iteration, gm)
-            dbhandler.write_population(iteration, population)
+            dbhandler.write_generation(iteration, gm, population)
 
-    @staticmethod
-    def __early_stop__(population):
-        return population.min() == population.max()
+    def __n_stale__(self, since=0):
+        """
+        :type since: int
+        :param since: optional - first generation to consider. Defaults to the first one.
+        :rtype: int
+        :return: Number of generations, from since onwards, since the best fitness last improved by more than
+            the tolerance.
+        """
+
+        best_so_far = np.maximum.accumulate(self.history[since:])
+        improved = np.flatnonzero(np.diff(np.hstack(([-np.inf], best_so_far))) > Individual.rtol)
+        return best_so_far.shape[0] - 1 - improved[-1]
+
+    def __set_height_cap__(self, gm, D):
+        """
+        Sets the maximum depth of trees, and of the graphical model, for the following generations.
+
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Current graphical model.
+        :type D: int
+        :param D: Maximum depth.
+        """
+
+        self._height_cap = D
+        DecisionTree.max_height = D
+        gm.set_depth(D)
+
+    def __curriculum__(self, gm, scores, **kwargs):
+        """
+        Records the cost of the last generation with the current height cap, and grows the cap if the evolution
+        plateaued. See Ardennes.fit.
+
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Current graphical model.
+        :type scores: numpy.ndarray
+        :param scores: Scores of the current population.
+        """
+
+        patience = kwargs['curriculum_patience'] if 'curriculum_patience' in kwargs and \
+            kwargs['curriculum_patience'] is not None else 2
+
+        self._cap_costs += [self._generation_cost]
+        self._expected_cost = {
+            k: float(np.mean([cost[k] for cost in self._cap_costs])) for k in ['elapsed_time', 'n_split_evaluations']
+        }
+
+        if self._height_cap >= self.D:
+            return
+
+        plateau = self.__n_stale__(self._cap_start) >= patience or \
+            all([key.min() == key.max() for key in Individual.rank_keys(scores)])
+
+        if plateau:
+            # trees may have up to twice as many nodes, and cost up to twice as much, with one more level
+            growth = get_total_nodes(self._height_cap + 1) / float(get_total_nodes(self._height_cap))
+            self._expected_cost = {k: v * growth for k, v in self._expected_cost.iteritems()}
 
-    def predict(self, test_set):
-        y_test_pred = list(self.predictor.predict(test_set))
+            self.__set_height_cap__(gm, self._height_cap + 1)
+            self._cap_start, self._cap_costs = len(self.history), []
+
+    def __early_stop__(self, population, scores, gm, **kwargs):
+        """
+        Checks the stopping criteria of the evolution. See Ardennes.fit for the optional ones.
+
+        :type population: numpy.ndarray
+        :param population: Current population.
+        :type scores: numpy.ndarray
+        :param scores: Scores of the current population.
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Current graphical model.
+        :rtype: list
+        :return: A description of each criterion which fired. Evolution stops if it is not empty.
+        """
+
+        fired = []
+
+        # while a curriculum may still grow trees (or has just grown them), the evolution has not converged
+        if self._height_cap is not None and (self._height_cap < self.D or self._cap_start >= len(self.history)):
+            converging = False
+        else:
+            converging = True
+
+        # whether every individual has the same rank keys, i.e. the best and the worst are equal
+        if converging and all([key.min() == key.max() for key in Individual.rank_keys(scores)]):
+            fired += ['every individual is equal']
+
+        if converging and 'min_entropy' in kwargs and kwargs['min_entropy'] is not None:
+            entropy = gm.entropy()
+            if entropy < kwargs['min_entropy']:
+                fired += ['model entropy %0.6f is below %0.6f' % (entropy, kwargs['min_entropy'])]
+
+        if converging and 'patience' in kwargs and kwargs['patience'] is not None:
+            n_stale = self.__n_stale__(self._cap_start)
+            if n_stale >= kwargs['patience']:
+                fired += ['best fitness has not improved for %d generations' % n_stale]
+
+        if converging and 'max_duplicates' in kwargs and kwargs['max_duplicates'] is not None:
+            n_unique = len(set([ind.structure_hash for ind in population]))
+            duplicates = 1. - n_unique / float(len(population))
+            if duplicates > kwargs['max_duplicates']:
+                fired += ['%0.2f%% of individuals are duplicates' % (100. * duplicates)]
+
+        # budgets: stops before a generation which, costing as much as the last one, would exceed them
+        for name, spent, cost in [
+            ('time_budget', self.elapsed_time, 'elapsed_time'),
+            ('evaluation_budget', self.n_evaluations, 'n_evaluations'),
+            ('split_budget', self.n_split_evaluations, 'n_split_evaluations')
+        ]:
+            if name in kwargs and kwargs[name] is not None and spent + self._generation_cost[cost] > kwargs[name]:
+                fired += ['%s of %s would be exceeded' % (name.replace('_', ' '), str(kwargs[name]))]
+
+        return fired
+
+    def predict(self, test_set, n_jobs=1):
+        """
+        Makes predictions for unseen data.
+
+        :type test_set: pandas.DataFrame
+        :param test_set: Unseen data, with the same predictive attributes as the training set.
+        :type n_jobs: int
+        :param n_jobs: optional - number of processes used for scoring. For large batches, -1 (all cores)
+            splits rows among processes which share the input and output arrays. Defaults to 1.
+        :rtype: list
+        :return: A list of predicted class labels.
+        """
+
+        if n_jobs == 1:
+            y_test_pred = list(self.predictor.predict(test_set))
+        else:
+            data = test_set[DecisionTree.dataset_info.pred_attr].values.astype(np.float32)
+            y_test_pred = list(self.predictor.predict_array(data, n_jobs=n_jobs))
         return y_test_pred
+
+    def predict_vote(self, test_set, k=None):
+        """
+        Makes predictions by majority vote among the k best individuals of the last generation. Splits shared
+        among those individuals are evaluated only once per object.
+
+        :type test_set: pandas.DataFrame
+        :param test_set: Unseen data, with the same predictive attributes as the training set.
+        :type k: int
+        :param k: optional - number of individuals which vote. Defaults to the whole population.
+        :rtype: list
+        :return: A list of predicted class labels.
+        """
+
+        voter = self.get_voter(k)
+        data = test_set[DecisionTree.dataset_info.pred_attr].values.astype(np.float32)
+        return list(DecisionTree.dataset_info.class_labels[voter.predict(data)])
+
+    def get_voter(self, k=None):
+        """
+        Merges the k best individuals of the last generation into a single predictor.
+
+        :type k: int
+        :param k: optional - number of individuals which vote. Defaults to the whole population.
+        :rtype: treelib.ensemble.PopulationVote
+        :return: The merged predictor.
+        """
+
+        k = self.n_individuals if k is None else k
+        return PopulationVote(
+            [ind.to_arrays() for ind in self.population[:k]],
+            n_classes=DecisionTree.dataset_info.class_labels.shape[0]
+        )
+
+    def predict_stream(self, source, chunk_size=100000, n_columns=None):
+        """
+        Makes predictions for a dataset which may not fit in memory, by reading it in chunks of rows.
+        Memory usage is bounded by the chunk size, regardless of the size of the dataset.
+
+        :param source: Either a path to an .arff, .csv, .npy or raw float32 binary file, or a
+            numpy.ndarray or pandas.DataFrame. Files with a header must have the same attribute names as the
+            training set; otherwise, predictive attributes must be in the same order as in the training set.
+        :type chunk_size: int
+        :param chunk_size: optional - number of rows read at once. Defaults to 100000.
+        :type n_columns: int
+        :param n_columns: optional - number of columns of raw binary files.
+        :rtype: generator
+        :return: A generator of numpy.ndarray, each one with the predictions for a chunk of rows.
+        """
+
+        from preprocessing.stream import iter_chunks
+
+        pred_attr = DecisionTree.dataset_info.pred_attr
+        arrays = self.predictor.to_arrays()
+
+        for chunk in iter_chunks(source, chunk_size, n_columns=n_columns):
+            if isinstance(chunk, pd.DataFrame):
+                chunk = chunk[pred_attr].values.astype(np.float32)
+            yield self.predictor.predict_array(chunk, arrays=arrays)
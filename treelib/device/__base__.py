@@ -4,15 +4,26 @@ import pandas as pd
 from collections import Counter
 from c_individual import make_predictions
 
+from scorer import predict_arrays
+
 
 class Device(object):
-    def __init__(self, dataset, dataset_info):
+    # order in which the correct counts are returned by get_correct_counts
+    partition_names = ['train', 'val', 'test']
+
+    _race_order = None  # type: np.ndarray  # order in which rows are visited by race
+    race_rows = None  # type: np.ndarray  # training rows, in the order they are visited by race
+
+    def __init__(self, dataset, dataset_info, arg_sets=None):
         """
 
         :type dataset: pandas.DataFrame
         :param dataset:
         :type dataset_info: treelib.utils.MetaDataset
         :param dataset_info:
+        :type arg_sets: dict
+        :param arg_sets: optional - a dictionary where keys are partition names (train, val, test) and values
+            boolean masks over the rows of the dataset.
         """
 
         self.dataset_info = dataset_info
@@ -25,6 +36,37 @@ class Device(object):
         self.dataset_info = dataset_info
         self.dataset = dataset.apply(self.__class_to_num__, axis=1).astype(np.float32)
 
+        self.partitions = None
+        if arg_sets is not None:
+            self.set_arg_sets(arg_sets)
+
+    def set_arg_sets(self, arg_sets):
+        """
+        Sets which rows of the dataset belong to each one of the partitions.
+
+        :type arg_sets: dict
+        :param arg_sets: a dictionary where keys are partition names and values boolean masks over the rows.
+        """
+
+        self.partitions = np.zeros(self.dataset.shape[0], dtype=np.int32)
+        for i, name in enumerate(Device.partition_names):
+            self.partitions |= np.asarray(arg_sets[name], dtype=np.int32) << i
+
+        if self._race_order is not None:
+            self.race_rows = self._race_order[(self.partitions[self._race_order] & 1).astype(np.bool)]
+
+    def set_race_order(self, order):
+        """
+        Sets the order in which training rows are visited by Device.race. Rows must be in random order, so that
+        every prefix of the order is a random sample of the training partition.
+
+        :type order: numpy.ndarray
+        :param order: A permutation of the rows of the dataset.
+        """
+
+        self._race_order = order
+        self.race_rows = order[(self.partitions[order] & 1).astype(np.bool)]
+
     def __class_to_num__(self, x):
         class_label = x.axes[0][-1]
 
@@ -75,6 +117,97 @@ class Device(object):
 
         return preds
 
+    def get_correct_counts(self, dt):
+        """
+        Counts how many objects from each partition are correctly classified by a decision tree.
+
+        :type dt: treelib.individual.DecisionTree
+        :param dt: Decision tree.
+        :rtype: numpy.ndarray
+        :return: An array with the number of correct predictions in each partition, in the order
+            given by Device.partition_names.
+        """
+
+        predictions = self.predict(self.dataset, dt, inner=True)
+        predictions = np.array([self.dataset_info.class_label_index[x] for x in predictions], dtype=np.int32)
+
+        hits = predictions == self.dataset[self.dataset_info.target_attr].values.astype(np.int32)
+
+        counts = np.array(
+            [np.count_nonzero(hits & (self.partitions & (1 << i)).astype(np.bool))
+             for i in xrange(len(Device.partition_names))],
+            dtype=np.int32
+        )
+        return counts
+
+    def race_counter(self, dt):
+        """
+        Prepares a decision tree to be raced on blocks of training rows (see Device.race).
+
+        :type dt: treelib.individual.DecisionTree
+        :param dt: Decision tree.
+        :rtype: function
+        :return: A function count(start, stop), which returns how many objects in race_rows[start:stop] are
+            correctly classified by the tree.
+        """
+
+        rows = self.race_rows
+        data = self.dataset.values
+        y_true = data[:, -1].astype(np.int32)
+        arrays = dt.to_arrays()  # converted once; every block is then predicted with vectorized numpy code
+
+        def count(start, stop):
+            block = rows[start:stop]
+            return np.count_nonzero(predict_arrays(data[block], arrays) == y_true[block])
+
+        return count
+
+    def race(self, dt, cutoff, block_size, delta):
+        """
+        Counts how many training objects are correctly classified by a decision tree, in blocks of rows, and
+        gives up as soon as its training accuracy provably cannot reach cutoff. After each block, the accuracy
+        is bounded from above by Hoeffding's inequality (with Serfling's correction for sampling without
+        replacement) and by assuming every remaining object to be correct; the tighter bound is used.
+
+        The accuracy is checked once per block, so each check uses confidence delta / n_checks: by the union
+        bound, the probability of giving up on a tree whose accuracy would reach cutoff is at most delta over
+        the whole race.
+
+        :type dt: treelib.individual.DecisionTree
+        :param dt: Decision tree.
+        :type cutoff: float
+        :param cutoff: Training accuracy the tree must be able to reach.
+        :type block_size: int
+        :param block_size: Number of rows per block.
+        :type delta: float
+        :param delta: Probability of giving up on a tree whose accuracy would actually reach cutoff.
+        :rtype: tuple
+        :return: The number of correct predictions and the number of training objects visited. If every
+            training object was visited, the count is exact.
+        """
+
+        n_rows = self.race_rows.shape[0]
+        count = self.race_counter(dt)
+
+        # no check is made after the last block, since its count is exact
+        n_checks = max(int(np.ceil(n_rows / float(block_size))) - 1, 1)
+        log_delta = np.log(n_checks / delta)
+
+        n_correct, n_seen = 0, 0
+        for start in xrange(0, n_rows, block_size):
+            stop = min(start + block_size, n_rows)
+
+            n_correct += count(start, stop)
+            n_seen = stop
+
+            if n_seen < n_rows:
+                epsilon = np.sqrt((1. - (n_seen - 1.) / n_rows) * log_delta / (2. * n_seen))
+                upper = min(n_correct / float(n_seen) + epsilon, (n_correct + n_rows - n_seen) / float(n_rows))
+                if upper < cutoff:
+                    break
+
+        return n_correct, n_seen
+
     @staticmethod
     def __split_info__(subset, subset_left, subset_right):
         split_info = 0.
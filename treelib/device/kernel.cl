@@ -123,6 +123,39 @@ __kernel void gain_ratio(
 #define TERM 2
 #define ATTR 3
 
+#define N_PARTITIONS 3
+
+int predict_object(
+    __global float *dataset, int n_attributes, int idx,
+    __global float *tree, int n_data,
+    int multi_tests) {
+
+    float current_node = 0;
+    while(TRUE) {
+        float terminal = at(tree, n_data, current_node, TERM);
+
+        if(terminal) {
+            return (int)at(tree, n_data, current_node, ATTR);
+        }
+
+        int i, go_right = 0;
+        float attribute, threshold;
+        for(i = 0; i < multi_tests; i++) {
+            attribute = at(tree, n_data, current_node, ATTR + (i * 2));
+            threshold = at(tree, n_data, current_node, ATTR + (i * 2) + 1);
+
+            if(at(dataset, n_attributes, idx, attribute) > threshold) {
+                go_right += 1;
+            }
+        }
+        if(go_right > (multi_tests/2)) {
+            current_node = at(tree, n_data, current_node, RIGHT);
+        } else {
+            current_node = at(tree, n_data, current_node, LEFT);
+        }
+    }
+}
+
 __kernel void predict(
     __global float *dataset, int n_objects, int n_attributes,
     __global float *tree, int n_data,
@@ -132,30 +165,85 @@ __kernel void predict(
     const int idx = get_global_id(0);
 
     if (idx < n_predictions) {
-        float current_node = 0;
-        while(TRUE) {
-            float terminal = at(tree, n_data, current_node, TERM);
+        predictions[idx] = predict_object(dataset, n_attributes, idx, tree, n_data, multi_tests);
+    }
+}
 
-            if(terminal) {
-                predictions[idx] = (int)at(tree, n_data, current_node, ATTR);
-                break;
-            }
+/**
+ * Counts how many objects are correctly classified by the tree in each one of the
+ * partitions (i.e. train, val and test sets) of the dataset. partitions is a bitmask
+ * per object, where the i-th bit tells whether the object belongs to the i-th partition.
+ * Counts are first reduced within the work group, and then added to the global counters.
+ */
+__kernel void correct_counts(
+    __global float *dataset, int n_objects, int n_attributes,
+    __global float *tree, int n_data,
+    __global int *partitions, __global int *counts,
+    int multi_tests) {
+
+    const int idx = get_global_id(0);
+    const int local_idx = get_local_id(0);
 
-            int i, go_right = 0;
-            float attribute, threshold;
-            for(i = 0; i < multi_tests; i++) {
-                attribute = at(tree, n_data, current_node, ATTR + (i * 2));
-                threshold = at(tree, n_data, current_node, ATTR + (i * 2) + 1);
+    __local int local_counts[N_PARTITIONS];
 
-                if(at(dataset, n_attributes, idx, attribute) > threshold) {
-                    go_right += 1;
+    if(local_idx < N_PARTITIONS) {
+        local_counts[local_idx] = 0;
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    if(idx < n_objects) {
+        int prediction = predict_object(dataset, n_attributes, idx, tree, n_data, multi_tests);
+        int true_class = (int)at(dataset, n_attributes, idx, n_attributes - 1);
+
+        if(prediction == true_class) {
+            int p;
+            for(p = 0; p < N_PARTITIONS; p++) {
+                if(partitions[idx] & (1 << p)) {
+                    atomic_inc(&local_counts[p]);
                 }
             }
-            if(go_right > (multi_tests/2)) {
-                current_node = at(tree, n_data, current_node, RIGHT);
-            } else {
-                current_node = at(tree, n_data, current_node, LEFT);
-            }
         }
     }
-}
\ No newline at end of file
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    if(local_idx < N_PARTITIONS) {
+        atomic_add(&counts[local_idx], local_counts[local_idx]);
+    }
+}
+
+/**
+ * Counts how many objects in rows[start:start + n_rows] are correctly classified by the tree.
+ * rows holds the training rows in the order they are visited while racing; each block of the
+ * race is a range over it.
+ */
+__kernel void race_count(
+    __global float *dataset, int n_attributes,
+    __global float *tree, int n_data,
+    __global int *rows, int start, int n_rows,
+    __global int *n_correct, int multi_tests) {
+
+    const int idx = get_global_id(0);
+    const int local_idx = get_local_id(0);
+
+    __local int local_n_correct;
+
+    if(local_idx == 0) {
+        local_n_correct = 0;
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    if(idx < n_rows) {
+        int row = rows[start + idx];
+        int prediction = predict_object(dataset, n_attributes, row, tree, n_data, multi_tests);
+        int true_class = (int)at(dataset, n_attributes, row, n_attributes - 1);
+
+        if(prediction == true_class) {
+            atomic_inc(&local_n_correct);
+        }
+    }
+    barrier(CLK_LOCAL_MEM_FENCE);
+
+    if(local_idx == 0) {
+        atomic_add(n_correct, local_n_correct);
+    }
+}
@@ -12,8 +12,12 @@ class CLDevice(Device):
     MIN_N_THREADS = 32
     MAX_N_THREADS = 1024
 
-    def __init__(self, dataset, dataset_info):
-        super(CLDevice, self).__init__(dataset, dataset_info)
+    def __init__(self, dataset, dataset_info, arg_sets=None):
+        # partitions are only transferred to the device once the OpenCL context is created
+        super(CLDevice, self).__init__(dataset, dataset_info, arg_sets=None)
+
+        self.mem_partitions = None
+        self.mem_race_rows = None
 
         kernel = open(os.path.join(self._split, 'kernel.cl'), 'r').read()
 
@@ -28,6 +32,30 @@ class CLDevice(Device):
 
         self._func_gain_ratio = self.prg.gain_ratio
         self._func_predict = self.prg.predict
+        self._func_correct_counts = self.prg.correct_counts
+        self._func_race_count = self.prg.race_count
+
+        if arg_sets is not None:
+            self.set_arg_sets(arg_sets)
+
+    def set_arg_sets(self, arg_sets):
+        super(CLDevice, self).set_arg_sets(arg_sets)
+
+        self.mem_partitions = cl.Buffer(
+            self.ctx, self.flags.READ_ONLY | self.flags.COPY_HOST_PTR, hostbuf=self.partitions
+        )  # transfers partitions to device memory; they only change when the training rows are subsampled
+
+        self.__transfer_race_rows__()
+
+    def set_race_order(self, order):
+        super(CLDevice, self).set_race_order(order)
+        self.__transfer_race_rows__()
+
+    def __transfer_race_rows__(self):
+        if self.race_rows is not None:
+            self.mem_race_rows = cl.Buffer(
+                self.ctx, self.flags.READ_ONLY | self.flags.COPY_HOST_PTR, hostbuf=self.race_rows.astype(np.int32)
+            )  # blocks are then given as ranges over this buffer, so that no rows are transferred while racing
 
     def get_gain_ratios(self, subset_index, attribute, candidates):
         n_candidates = candidates.shape[0]
@@ -112,3 +140,80 @@ class CLDevice(Device):
             predictions = [self.dataset_info.inv_class_label_index[x] for x in predictions]
             return predictions
 
+    def race_counter(self, dt):
+        dt_matrix = dt.to_matrix()
+
+        _mem_tree = cl.Buffer(
+            self.ctx, self.flags.READ_ONLY | self.flags.COPY_HOST_PTR, hostbuf=dt_matrix.values.ravel()
+        )  # transferred once per race, not once per block
+
+        def count(start, stop):
+            n_rows = stop - start
+            n_correct = np.zeros(1, dtype=np.int32)
+
+            n_threads = n_rows if (n_rows % CLDevice.MIN_N_THREADS == 0) else \
+                ((n_rows / CLDevice.MIN_N_THREADS) + 1) * CLDevice.MIN_N_THREADS
+
+            _mem_n_correct = cl.Buffer(
+                self.ctx, self.flags.READ_WRITE | self.flags.COPY_HOST_PTR, hostbuf=n_correct
+            )
+
+            self._func_race_count(  # returns an event, for blocking
+                self.queue,
+                (n_threads, ),
+                (CLDevice.MIN_N_THREADS, ),
+                self.mem_dataset,
+                np.int32(self.dataset_info.n_attributes),
+                _mem_tree,
+                np.int32(dt_matrix.shape[1]),
+                self.mem_race_rows,
+                np.int32(start),
+                np.int32(n_rows),
+                _mem_n_correct,
+                np.int32(dt.multi_tests),
+            )
+
+            cl.enqueue_copy(self.queue, n_correct, _mem_n_correct)
+            return int(n_correct[0])
+
+        return count
+
+    def get_correct_counts(self, dt):
+        n_objects = self.dataset_info.n_objects
+
+        counts = np.zeros(len(CLDevice.partition_names), dtype=np.int32)
+
+        n_threads = n_objects if (n_objects % CLDevice.MIN_N_THREADS == 0) else \
+            ((n_objects / CLDevice.MIN_N_THREADS) + 1) * CLDevice.MIN_N_THREADS
+
+        dt_matrix = dt.to_matrix()
+
+        _mem_tree = cl.Buffer(
+            self.ctx, self.flags.READ_ONLY | self.flags.COPY_HOST_PTR, hostbuf=dt_matrix.values.ravel()
+        )
+
+        _mem_counts = cl.Buffer(
+            self.ctx, self.flags.READ_WRITE | self.flags.COPY_HOST_PTR, hostbuf=counts
+        )
+
+        global_size = (n_threads, )  # any size you want, but must be a multiple of 32
+        local_size = (CLDevice.MIN_N_THREADS, )  # must be a multiple of 32
+
+        self._func_correct_counts(  # returns an event, for blocking
+            self.queue,
+            global_size,
+            local_size,
+            self.mem_dataset,
+            np.int32(n_objects),
+            np.int32(self.dataset_info.n_attributes),
+            _mem_tree,
+            np.int32(dt_matrix.shape[1]),
+            self.mem_partitions,
+            _mem_counts,
+            np.int32(dt.multi_tests),
+        )
+
+        cl.enqueue_copy(self.queue, counts, _mem_counts)  # only a few integers are copied back to host
+
+        return counts
+
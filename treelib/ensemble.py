@@ -0,0 +1,171 @@
+# coding=utf-8
+
+"""
+Majority-vote scoring with several trees from the final population of Ardennes.
+
+Trees sampled from the same graphical model tend to share their upper-level splits. Instead of routing
+every object through each tree separately, the trees are merged into a forest of shared nodes: trees
+with the same test at the same path are collapsed into a single node, which is evaluated only once per
+object.
+"""
+
+import numpy as np
+
+__author__ = 'Henry Cagnini'
+
+
+class PopulationVote(object):
+    def __init__(self, trees, n_classes):
+        """
+
+        :type trees: list
+        :param trees: List of decision trees, each one in the format returned by DecisionTree.to_arrays.
+        :type n_classes: int
+        :param n_classes: Number of classes in the dataset.
+        """
+
+        self.n_trees = len(trees)
+        self.n_classes = n_classes
+
+        self._tests = []  # one (attributes, thresholds) tuple per shared node
+        self._successors = []  # two lists per shared node (left, right), plus one for the roots
+
+        roots = self.__merge__(trees, [(t, 0) for t in xrange(len(trees))])
+        self._successors += [roots]
+
+        self.__flatten__()
+
+    @property
+    def n_nodes(self):
+        """
+        Number of shared inner nodes.
+        """
+
+        return self.node_attributes.shape[0]
+
+    def __merge__(self, trees, items):
+        """
+        Merges nodes from several trees which are reached by the same path.
+
+        :param trees: List of decision trees, in the format returned by DecisionTree.to_arrays.
+        :type items: list
+        :param items: list of (tree index, node position) tuples, all reached by the same path.
+        :rtype: list
+        :return: list of successors, where each successor is either a (True, tree index, class index) leaf or
+            a (False, shared node id, None) inner node.
+        """
+
+        successors = []
+        groups = dict()
+
+        for t, pos in items:
+            tree = trees[t]
+            if tree['terminal'][pos]:
+                successors += [(True, t, tree['classes'][pos])]
+            else:
+                key = (tuple(tree['attributes'][pos]), tuple(tree['thresholds'][pos]))
+                groups.setdefault(key, []).append((t, pos))
+
+        for (attributes, thresholds), group in groups.iteritems():
+            node_id = len(self._tests)
+            self._tests += [(attributes, thresholds)]
+            self._successors += [None, None]
+
+            left = self.__merge__(trees, [(t, trees[t]['left'][pos]) for t, pos in group])
+            right = self.__merge__(trees, [(t, trees[t]['right'][pos]) for t, pos in group])
+
+            self._successors[2 * node_id] = left
+            self._successors[2 * node_id + 1] = right
+
+            successors += [(False, node_id, None)]
+
+        return successors
+
+    def __flatten__(self):
+        """
+        Converts shared nodes and their successors to flat arrays. Successors of shared node m
+        in direction d (0 left, 1 right) are at positions [pointers[2m + d], pointers[2m + d + 1]);
+        roots are the successors of the last slot.
+        """
+
+        multi_tests = len(self._tests[0][0]) if len(self._tests) > 0 else 1
+
+        self.node_attributes = np.array([x[0] for x in self._tests], dtype=np.int32).reshape(-1, multi_tests)
+        self.node_thresholds = np.array([x[1] for x in self._tests], dtype=np.float32).reshape(-1, multi_tests)
+
+        slots = self._successors
+
+        sizes = np.array([len(x) for x in slots], dtype=np.int64)
+        self.pointers = np.hstack(([0], np.cumsum(sizes)))
+
+        flat = [s for slot in slots for s in slot]
+        self.succ_is_leaf = np.array([x[0] for x in flat], dtype=np.bool)
+        self.succ_node = np.array([x[1] if not x[0] else -1 for x in flat], dtype=np.int32)
+        self.succ_class = np.array([x[2] if x[0] else -1 for x in flat], dtype=np.int32)
+
+        self.root_slot = len(slots) - 1
+
+        del self._tests, self._successors
+
+    def __expand__(self, rows, slots):
+        """
+        Gets all successors for a set of (object, slot) pairs.
+        """
+
+        starts = self.pointers[slots]
+        counts = self.pointers[slots + 1] - starts
+
+        total = counts.sum()
+        offsets = np.repeat(starts - np.hstack(([0], np.cumsum(counts)[:-1])), counts)
+
+        return np.repeat(rows, counts), offsets + np.arange(total)
+
+    def votes(self, data):
+        """
+        Counts the votes of each tree for each object.
+
+        :type data: numpy.ndarray
+        :param data: A two-dimensional array where each row is an object.
+        :rtype: numpy.ndarray
+        :return: A matrix with one row per object and one column per class.
+        """
+
+        n_objects = data.shape[0]
+        multi_tests = self.node_attributes.shape[1]
+
+        votes = np.zeros(n_objects * self.n_classes, dtype=np.int64)
+
+        rows = np.arange(n_objects)
+        slots = np.full(n_objects, self.root_slot, dtype=np.int64)
+
+        while rows.shape[0] > 0:
+            rows, succ = self.__expand__(rows, slots)
+
+            is_leaf = self.succ_is_leaf[succ]
+            votes += np.bincount(
+                rows[is_leaf] * self.n_classes + self.succ_class[succ[is_leaf]], minlength=votes.shape[0]
+            )
+
+            rows = rows[~is_leaf]
+            nodes = self.succ_node[succ[~is_leaf]]
+
+            # every shared node is evaluated only once per object
+            go_right = np.zeros(rows.shape[0], dtype=np.int32)
+            for i in xrange(multi_tests):
+                go_right += data[rows, self.node_attributes[nodes, i]] > self.node_thresholds[nodes, i]
+
+            slots = 2 * nodes.astype(np.int64) + (go_right > (multi_tests / 2))
+
+        return votes.reshape(n_objects, self.n_classes)
+
+    def predict(self, data):
+        """
+        Makes predictions by majority vote. Ties are broken in favor of the class with the lowest index.
+
+        :type data: numpy.ndarray
+        :param data: A two-dimensional array where each row is an object.
+        :rtype: numpy.ndarray
+        :return: The index of the predicted class for each one of the objects.
+        """
+
+        return np.argmax(self.votes(data), axis=1)
@@ -1,109 +1,465 @@
 # coding=utf-8
-import copy
-
 from node import *
 import pandas as pd
-from collections import Counter
-import operator as op
 
 __author__ = 'Henry Cagnini'
 
 
 class GraphicalModel(object):
-    def __init__(self, D, dataset_info, multi_tests):
+    """
+    Probabilistic model of which label (i.e. attribute or class) each node of a decision tree tests.
+
+    Nodes are materialized lazily: a node only has its own distribution while it is used by one of the
+    fittest individuals. Otherwise, it follows a default prior shared by every non-materialized node; hence,
+    memory grows with the nodes actually used, and not with 2^D.
+    """
+
+    def __init__(self, D, dataset_info, multi_tests, random_state=None):
+        """
+
+        :type D: int
+        :param D: Maximum depth of the model.
+        :type dataset_info: treelib.utils.MetaDataset
+        :param dataset_info: Metadata of the dataset.
+        :type multi_tests: int
+        :param multi_tests: Number of labels sampled per node.
+        :param random_state: optional - either a seed or a numpy.random.RandomState. Every draw of the model
+            comes from this generator, and never from the global state of numpy.
+        """
+
         self.D = D
         self.dataset_info = dataset_info
         self.multi_tests = multi_tests
 
-        self.attributes = self.__init_attributes__(D)
+        if isinstance(random_state, np.random.RandomState):
+            self.random_state = random_state
+        else:
+            self.random_state = np.random.RandomState(random_state)
+
+        # rows of the model: predictive attributes first, class attribute last
+        self.labels = np.hstack((self.dataset_info.pred_attr, [self.dataset_info.target_attr]))
+        self.label_index = {k: i for i, k in enumerate(self.labels)}  # type: dict
+
+        self.n_variables = get_total_nodes(D - 1)  # since the probability of generating the class at D is 100%
+
+        self.nodes = np.empty(0, dtype=np.int64)  # ids of materialized nodes, sorted
+        self.node_index = dict()  # type: dict  # node id: column of the node in the model
+
+        self.attributes = self.__init_attributes__(D)  # type: np.ndarray
+        self.default = self.__init_default__()  # type: np.ndarray
+        self.__init_cdf__()
+
+    def set_depth(self, D):
+        """
+        Changes the maximum depth of the model. Nodes between the previous and the new depth are not
+        materialized, and follow the default prior until they are used; materialized nodes deeper than the new
+        depth are ignored.
+
+        :type D: int
+        :param D: New maximum depth of the model.
+        """
+
+        self.D = D
+        self.n_variables = get_total_nodes(D - 1)
 
     def __init_attributes__(self, D):
-        def set_probability(column):
-            n_attributes = column.index.shape[0]  # class attribute is the last one
+        """
+        Initializes the model as a dense (attributes x materialized nodes) matrix, where each column is the
+        probability distribution of labels for a node. No node is materialized at first.
+
+        :type D: int
+        :param D: Maximum depth of the model.
+        :rtype: numpy.ndarray
+        :return: The probability matrix.
+        """
+
+        return np.empty((self.labels.shape[0], 0), dtype=np.float64)
+
+    def __init_default__(self):
+        """
+        Prior distribution of nodes which are not materialized yet.
+
+        :rtype: numpy.ndarray
+        :return: Probability of each label.
+        """
+
+        n_attributes = self.labels.shape[0]  # class attribute is the last one
+
+        class_prob = 0.  # zero probability
+        # class_prob = (1. / (D + 1)) * float(d)  # linear progression
+        pred_prob = (1. - class_prob) / (n_attributes - 1.)
+
+        default = np.empty(n_attributes, dtype=np.float64)
+        default[-1] = class_prob
+        default[:-1] = pred_prob
+
+        return default
+
+    def __init_cdf__(self):
+        """
+        Computes the cumulative distribution of each materialized node and of the default prior,
+        used for inverse-CDF sampling.
+        """
 
-            d = get_depth(column.name)
+        self.cdf = np.cumsum(self.attributes.T, axis=1)  # one row per materialized node
+        self.cdf[:, -1] = 1.  # prevents rounding errors from leaving uniform draws out of the distribution
 
-            class_prob = 0.  # zero probability
-            # class_prob = (1. / (D + 1)) * float(d)  # linear progression
-            pred_prob = (1. - class_prob) / (n_attributes - 1.)
+        self.default_cdf = np.cumsum(self.default)
+        self.default_cdf[-1] = 1.
 
-            column[-1] = class_prob
-            column[:-1] = pred_prob
+    def __set_nodes__(self, nodes):
+        """
+        Sets which nodes are materialized.
+
+        :type nodes: numpy.ndarray
+        :param nodes: Sorted ids of materialized nodes.
+        """
+
+        self.nodes = nodes
+        self.node_index = {k: i for i, k in enumerate(nodes)}
+
+    def __fittest_labels__(self, fittest):
+        """
+        Gathers the labels sampled by the fittest individuals.
+
+        :type fittest: numpy.ndarray
+        :param fittest: The fittest individuals of the current generation.
+        :rtype: tuple
+        :return: A tuple with four arrays: node ids and label indices of each (node, label) pair; the sorted ids
+            of nodes used by at least one individual, and how many individuals use each of them.
+        """
+
+        target_index = self.label_index[self.dataset_info.target_attr]
+
+        label_indices = []
+        node_indices = []
+
+        for fit in fittest:
+            for node_id, node in fit.tree.node.iteritems():
+                if node_id >= self.n_variables:
+                    continue
+
+                if isinstance(node['label'], list):
+                    label_indices += [self.label_index[x] for x in node['label']]
+                    node_indices += [node_id] * len(node['label'])
+                else:  # class labels are counted multi_tests times, to increase chances of picking class
+                    label_indices += [target_index] * self.multi_tests
+                    node_indices += [node_id] * self.multi_tests
+
+        node_indices = np.array(node_indices, dtype=np.int64)
+        label_indices = np.array(label_indices, dtype=np.int64)
+
+        # every individual contributes exactly multi_tests labels to each node it has
+        used_nodes, used_counts = np.unique(node_indices, return_counts=True)
+        used_counts //= self.multi_tests
+
+        return node_indices, label_indices, used_nodes, used_counts
+
+    def entropy(self):
+        """
+        Mean normalized entropy of the distributions of all nodes of the model, up to its maximum depth. Nodes
+        which are not materialized count with the entropy of the default prior. Values near 1 mean nearly
+        uniform distributions; values near 0 mean the model has collapsed into a few labels per node.
+
+        :rtype: float
+        :return: Entropy, in [0, 1].
+        """
+
+        columns = self.nodes < self.n_variables  # nodes deeper than the maximum depth are ignored
 
-            rest = abs(column.values.sum() - 1.)
-            column[np.random.randint(0, n_attributes)] += rest
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terms = np.where(self.attributes > 0., self.attributes * np.log2(self.attributes), 0.)
+            default_terms = np.where(self.default > 0., self.default * np.log2(self.default), 0.)
 
-            return column
+        total = -terms[:, columns].sum() - (self.n_variables - np.count_nonzero(columns)) * default_terms.sum()
+        return float(total / (self.n_variables * np.log2(self.labels.shape[0])))
+
+    def to_table(self):
+        """
+        Lists the non-zero probabilities of the model.
+
+        :rtype: tuple
+        :return: A tuple with three aligned arrays: node ids, label indices and probabilities. Node id -1 denotes
+            the default prior of nodes which are not materialized.
+        """
 
-        n_variables = get_total_nodes(D - 1)  # since the probability of generating the class at D is 100%
+        labels, columns = np.nonzero(self.attributes)
+        default_labels = np.flatnonzero(self.default)
 
-        attributes = pd.DataFrame(
-            index=np.hstack((self.dataset_info.pred_attr, [self.dataset_info.target_attr])), columns=range(n_variables)
-        ).apply(set_probability, axis=0)
+        return (
+            np.hstack((self.nodes[columns], np.full(default_labels.shape[0], -1, dtype=np.int64))),
+            np.hstack((labels, default_labels)),
+            np.hstack((self.attributes[labels, columns], self.default[default_labels]))
+        )
 
-        return attributes
-    
     def update(self, fittest):
-        def get_label(_fit, _node_id):
-            if _node_id not in _fit.tree.node:
-                return None
+        """
+        Updates the model with the labels of the fittest individuals. For each node, the new distribution is
+        proportional to how many times each label was sampled in that node. Individuals which lack a given
+        node are grafted with labels drawn uniformly at random.
+
+        Only nodes used by at least one of the fittest individuals are counted, and materialized. Every other
+        node would be entirely grafted, so its distribution is reset, in closed form, to the expected graft
+        (i.e. uniform over all labels), which is the default prior. Thus, the cost of an update depends on the
+        number of nodes actually used, and not on the number of materialized nodes.
+
+        :type fittest: numpy.ndarray
+        :param fittest: The fittest individuals of the current generation.
+        """
+
+        n_attributes = self.labels.shape[0]
+
+        node_ids, label_indices, nodes, present = self.__fittest_labels__(fittest)
+        n_columns = nodes.shape[0]
+
+        # for each node, draws grafts for each individual that lacks it, followed by the
+        # index of the label which receives the rounding error; all in a single call
+        n_unsampled = (len(fittest) - present) * self.multi_tests
+        draws = self.random_state.randint(0, n_attributes, size=(n_unsampled + 1).sum())
+
+        ends = np.cumsum(n_unsampled + 1)
+        is_rest = np.zeros(draws.shape[0], dtype=np.bool)
+        is_rest[ends - 1] = True
+        draw_columns = np.repeat(np.arange(n_columns), n_unsampled + 1)
 
-            label = _fit.tree.node[_node_id]['label'] \
-                if _fit.tree.node[_node_id]['label'] not in self.dataset_info.class_labels \
-                else self.dataset_info.target_attr
-            return label
+        counts = np.bincount(
+            np.hstack((
+                np.searchsorted(nodes, node_ids) * n_attributes + label_indices,
+                draw_columns[~is_rest] * n_attributes + draws[~is_rest]
+            )),
+            minlength=n_columns * n_attributes
+        ).reshape(n_columns, n_attributes).T.astype(np.float64)
 
-        def __concatenate__(labels):
-            all = []
-            for _set in labels:
-                if isinstance(_set, list):
-                    all += _set
-                else:
-                    all += [_set] * self.multi_tests  # TODO to increase chances of picking class
-            return all
+        counts /= counts.sum(axis=0)
+        rest = np.abs(counts.sum(axis=0) - 1.)
+        counts[draws[is_rest], np.arange(n_columns)] += rest
 
-        def local_update(column):
-            labels = __concatenate__([get_label(fit, column.name) for fit in fittest])
-            n_unsampled = labels.count(None)
-            labels = [x for x in labels if x is not None]  # removes none from unsampled
+        self.__set_nodes__(nodes)
+        self.attributes = counts
+        self.default = np.full(n_attributes, 1. / n_attributes, dtype=np.float64)
+        self.__init_cdf__()
 
-            graft = [np.random.choice(column.index) for x in xrange(n_unsampled)]
+    def sample(self, n_individuals):
+        """
+        Draws every label needed by a batch of individuals at once, with a single uniform draw. Only
+        materialized nodes are drawn; other nodes are observed from the default prior when needed.
 
-            label_count = Counter(labels)
-            graft_count = Counter(graft)
+        :type n_individuals: int
+        :param n_individuals: Number of individuals.
+        :rtype: numpy.ndarray
+        :return: A (n_individuals x materialized nodes x multi_tests) array with indices of labels (see
+            GraphicalModel.labels). Nodes are in the same order as GraphicalModel.nodes.
+        """
 
-            label_count.update(graft_count)
+        n_columns, n_attributes = self.cdf.shape
 
-            column[:] = 0.
-            for k, v in label_count.iteritems():
-                column[column.index == k] = v
+        # shifts the cdf of each node by its index, so that all nodes are searched in a single sorted array
+        offsets = np.arange(n_columns, dtype=np.float64)
+        flat_cdf = (self.cdf + offsets[:, np.newaxis]).ravel()
 
-            column /= float(column.sum())
-            rest = abs(column.sum() - 1.)
-            column[np.random.choice(column.index)] += rest
+        uniform = self.random_state.random_sample((n_individuals, n_columns, self.multi_tests))
+        uniform += offsets[np.newaxis, :, np.newaxis]
 
-            return column
+        indices = np.searchsorted(flat_cdf, uniform, side='right')
+        indices -= (np.arange(n_columns) * n_attributes)[np.newaxis, :, np.newaxis]
 
-        self.attributes = self.attributes.apply(local_update, axis=0)
+        return np.minimum(indices, n_attributes - 1).astype(np.int32)
 
-    def observe(self, node_id, evidence=None):
+    def observe(self, node_id, evidence=None, random_state=None):
         """
         Makes observations about a given variable.
 
         :param node_id: ID of the node (i.e. variable) being observed.
         :param evidence: optional - evidence used for observing the variable. May be None if the variable is independent.
+        :type random_state: numpy.random.RandomState
+        :param random_state: optional - generator to draw from. Defaults to the generator of this model.
         :return: Observation of the variable, which is a set of values sampled from the variable's distribution.
         """
-        node_labels = []
-        variable = self.attributes[node_id]
-        # variable = self.attributes[node_id]
 
-        for i in xrange(self.multi_tests):
-            label = np.random.choice(a=variable.index, p=variable)
-            node_labels += [label]
-            # variable.loc[label] = 0
-            # variable = variable / variable.sum()
-            # rest = abs(variable.sum() - 1.)
-            # variable.loc[np.random.choice(variable.index)] += rest
+        if node_id >= self.n_variables:
+            raise KeyError(node_id)
+
+        random_state = self.random_state if random_state is None else random_state
+
+        cdf = self.cdf[self.node_index[node_id]] if node_id in self.node_index else self.default_cdf
+
+        indices = np.searchsorted(cdf, random_state.random_sample(self.multi_tests), side='right')
+        return self.labels[np.minimum(indices, self.labels.shape[0] - 1)]
+
+
+class SparseGraphicalModel(GraphicalModel):
+    """
+    Graphical model for datasets with many attributes. For each node, only labels with probability mass are
+    stored; every other label shares a residual mass, spread uniformly. Updates and sampling cost depend on the
+    number of distinct labels used by the fittest individuals, rather than on the number of attributes.
+
+    Grafts for individuals which lack a node are not drawn at random; instead, their expected (uniform)
+    contribution is added to the residual mass. Thus, a node used by none of the fittest individuals is
+    identical to the default prior, and is not materialized.
+    """
+
+    def __init_attributes__(self, D):
+        """
+        Initializes the sparse structures of the model. No node is materialized at first.
+
+        :type D: int
+        :param D: Maximum depth of the model.
+        :return: None, since there is no dense matrix. See explicit, residual and residual_size.
+        """
+
+        self.explicit = dict()  # node id: (label indices, probabilities) of labels with their own mass
+
+        # one position per materialized node: mass shared uniformly by labels [0, residual_size)
+        self.residual = np.empty(0, dtype=np.float64)
+        self.residual_size = np.empty(0, dtype=np.int64)
+
+        return None
+
+    def __init_default__(self):
+        """
+        The default prior is uniform over labels [0, default_size); at first, the class has zero probability.
+        """
+
+        self.default_size = self.labels.shape[0] - 1
+        return None
+
+    def __init_cdf__(self):
+        """
+        Computes the cumulative distribution of the explicit labels of every materialized node. The
+        cumulative distribution of the node in column c starts at its residual mass, and is shifted by c so
+        that all nodes are stored in a single sorted array.
+        """
+
+        flat_cdf, flat_labels = [np.empty(0, dtype=np.float64)], [np.empty(0, dtype=np.int32)]
+
+        for column, node_id in enumerate(self.nodes):
+            indices, probabilities = self.explicit[node_id]
+
+            cdf = self.residual[column] + np.cumsum(probabilities)
+            cdf[-1] = 1.  # prevents rounding errors from leaving uniform draws out of the distribution
+
+            flat_cdf += [cdf + column]
+            flat_labels += [indices]
+
+        self._flat_cdf = np.hstack(flat_cdf)
+        self._flat_labels = np.hstack(flat_labels)
+
+    def __inverse_cdf__(self, columns, uniform):
+        """
+        Converts uniform draws into labels.
+
+        :type columns: numpy.ndarray
+        :param columns: Column (i.e. position in GraphicalModel.nodes) of the node of each draw.
+        :type uniform: numpy.ndarray
+        :param uniform: Uniform draws in [0, 1), with the same shape as columns.
+        :rtype: numpy.ndarray
+        :return: Label indices, with the same shape as uniform.
+        """
+
+        residual = self.residual[columns]
+        in_residual = uniform < residual
+
+        indices = np.empty(uniform.shape, dtype=np.int32)
+
+        # draws which fall within the residual mass are rescaled to pick a label uniformly
+        res_size = self.residual_size[columns][in_residual]
+        indices[in_residual] = np.minimum(
+            (uniform[in_residual] / residual[in_residual] * res_size).astype(np.int64), res_size - 1
+        )
+
+        pos = np.searchsorted(self._flat_cdf, (uniform + columns)[~in_residual], side='right')
+        indices[~in_residual] = self._flat_labels[np.minimum(pos, self._flat_labels.shape[0] - 1)]
+
+        return indices
+
+    def entropy(self):
+        n_materialized = 0
+        total = 0.
+        for column, node_id in enumerate(self.nodes):
+            if node_id >= self.n_variables:  # deeper than the maximum depth
+                continue
+
+            indices, explicit = self.explicit[node_id]
+            size = self.residual_size[column]
+            share = self.residual[column] / size
+
+            in_residual = indices < size
+            probabilities = explicit + share * in_residual
+
+            total -= np.sum(probabilities * np.log2(probabilities))
+            if share > 0.:
+                total -= (size - np.count_nonzero(in_residual)) * share * np.log2(share)
+            n_materialized += 1
+
+        # the default prior is uniform over default_size labels
+        total += (self.n_variables - n_materialized) * np.log2(self.default_size)
+
+        return float(total / (self.n_variables * np.log2(self.labels.shape[0])))
+
+    def to_table(self):
+        """
+        Lists the probabilities of the model. For each node, only labels with their own mass are listed;
+        besides them, a row with label index -1 holds the probability of each one of the unlisted labels
+        (class excluded, if the node does not spread its residual mass over it).
+
+        :rtype: tuple
+        :return: A tuple with three aligned arrays: node ids, label indices and probabilities. Node id -1 denotes
+            the default prior of nodes which are not materialized.
+        """
+
+        nodes, labels, probabilities = [[-1]], [[-1]], [[1. / self.default_size]]
+
+        for column, node_id in enumerate(self.nodes):
+            indices, explicit = self.explicit[node_id]
+            share = self.residual[column] / self.residual_size[column]
+
+            nodes += [np.full(indices.shape[0] + 1, node_id, dtype=np.int64)]
+            labels += [indices, [-1]]
+            probabilities += [explicit + share * (indices < self.residual_size[column]), [share]]
+
+        return np.hstack(nodes), np.hstack(labels), np.hstack(probabilities)
+
+    def update(self, fittest):
+        n_attributes = self.labels.shape[0]
+        total = float(len(fittest) * self.multi_tests)  # number of labels per node, grafts included
+
+        node_ids, label_indices, used_nodes, used_counts = self.__fittest_labels__(fittest)
+
+        keys, counts = np.unique(node_ids * n_attributes + label_indices, return_counts=True)
+        nodes, labels = keys // n_attributes, (keys % n_attributes).astype(np.int32)
+
+        self.explicit = dict()
+        if keys.shape[0] > 0:
+            starts = np.hstack(([0], np.flatnonzero(np.diff(nodes)) + 1))
+            stops = np.hstack((starts[1:], [keys.shape[0]]))
+            for start, stop in zip(starts, stops):
+                self.explicit[int(nodes[start])] = (labels[start:stop], counts[start:stop] / total)
+
+        self.__set_nodes__(used_nodes)
+
+        # labels of individuals which lack a node are grafted uniformly over all labels
+        self.residual = (total - used_counts * self.multi_tests) / total
+        self.residual_size = np.full(used_nodes.shape[0], n_attributes, dtype=np.int64)
+        self.default_size = n_attributes
+
+        self.__init_cdf__()
+
+    def sample(self, n_individuals):
+        uniform = self.random_state.random_sample((n_individuals, self.nodes.shape[0], self.multi_tests))
+        columns = np.broadcast_to(np.arange(self.nodes.shape[0])[np.newaxis, :, np.newaxis], uniform.shape)
+
+        return self.__inverse_cdf__(columns, uniform)
+
+    def observe(self, node_id, evidence=None, random_state=None):
+        if node_id >= self.n_variables:
+            raise KeyError(node_id)
+
+        random_state = self.random_state if random_state is None else random_state
+        uniform = random_state.random_sample(self.multi_tests)
+
+        if node_id in self.node_index:
+            indices = self.__inverse_cdf__(np.full(self.multi_tests, self.node_index[node_id], dtype=np.int64), uniform)
+        else:
+            indices = (uniform * self.default_size).astype(np.int64)
 
-        return np.array(node_labels)
+        return self.labels[indices]
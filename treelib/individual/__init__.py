@@ -2,6 +2,7 @@
 
 from __tree__ import DecisionTree
 import networkx as nx
+import numpy as np
 import StringIO
 from matplotlib import pyplot as plt
 
@@ -13,6 +14,11 @@ class Individual(DecisionTree):
     # relative tolerance between two accuracies
     rtol = 1e-3
 
+    # scores of a population, stored as parallel arrays (see Individual.scores_of)
+    score_dtype = np.dtype([
+        ('fitness', np.float64), ('height', np.int32), ('n_nodes', np.int32), ('outer_fitness', np.float64)
+    ])
+
     def __init__(self, gm, **kwargs):
         self.ind_id = kwargs['ind_id'] if 'ind_id' in kwargs else None
         self.iteration = kwargs['iteration'] if 'iteration' in kwargs else None
@@ -62,9 +68,10 @@ class Individual(DecisionTree):
                 'individual id: %03.d' % self.ind_id,
                 'height: %d' % self.height,
                 'n_nodes: %d' % self.n_nodes,
-                'train accuracy: %0.4f' % self.train_acc_score,
-                'val accuracy: %0.4f' % self.val_acc_score,
-                'test accuracy: %0.4f' % self.test_acc_score if self.test_acc_score is not None else '',
+                'train accuracy: %s' % self.__format_score__(self.train_acc_score, 4),
+                'val accuracy: %s' % self.__format_score__(self.val_acc_score, 4),
+                'test accuracy: %s' % self.__format_score__(self.test_acc_score, 4),
+                'raced out: training accuracy estimated from a sample' if self.raced_out else '',
                 'iteration: %d' % self.iteration if self.iteration is not None else ''
 
             ]),
@@ -80,6 +87,55 @@ class Individual(DecisionTree):
             plt.savefig(savepath, bbox_inches='tight', format='pdf')
             plt.close()
 
+    @staticmethod
+    def scores_of(individuals):
+        """
+        Gathers the scores of several individuals.
+
+        :param individuals: A list or array of individuals.
+        :rtype: numpy.ndarray
+        :return: A structured array, with dtype Individual.score_dtype and one position per individual.
+        """
+
+        scores = np.empty(len(individuals), dtype=Individual.score_dtype)
+        scores['fitness'] = [ind.fitness for ind in individuals]
+        scores['height'] = [ind.height for ind in individuals]
+        scores['n_nodes'] = [ind.n_nodes for ind in individuals]
+        # individuals discarded by racing were never scored on the validation set
+        scores['outer_fitness'] = [
+            -np.inf if ind.raced_out else 0.5 * (ind.train_acc_score + ind.val_acc_score) for ind in individuals
+        ]
+        return scores
+
+    @staticmethod
+    def rank_keys(scores):
+        """
+        Keys which order individuals from worst to best, by the same criteria as rich comparisons: fitness,
+        then (smaller) height, then (smaller) number of nodes. Fitness is quantized to multiples of rtol,
+        so that fitnesses closer than rtol usually share the same key.
+
+        :type scores: numpy.ndarray
+        :param scores: Scores of the population, as returned by Individual.scores_of.
+        :rtype: tuple
+        :return: A tuple of keys for numpy.lexsort, where the last key is the primary one.
+        """
+
+        quantized = np.floor(scores['fitness'] / Individual.rtol + 0.5).astype(np.int64)
+        return -scores['n_nodes'], -scores['height'], quantized
+
+    @staticmethod
+    def rank(scores):
+        """
+        Ranks a population without calling rich comparisons.
+
+        :type scores: numpy.ndarray
+        :param scores: Scores of the population, as returned by Individual.scores_of.
+        :rtype: numpy.ndarray
+        :return: Indices which sort the population from best to worst individual.
+        """
+
+        return np.lexsort(Individual.rank_keys(scores))[::-1]
+
     def __is_close__(self, other, attribute_name):
         quality_diff = abs(getattr(self, attribute_name) - getattr(other, attribute_name))
         return quality_diff <= Individual.rtol
@@ -127,6 +183,15 @@ class Individual(DecisionTree):
         return True
 
     def __str__(self):
-        return 'train: %0.3f val: %0.3f n_nodes: %d height: %d' % (
-            self.train_acc_score, self.val_acc_score, self.n_nodes, self.height
-        )
+        return 'train: %s val: %s n_nodes: %d height: %d' % (
+            self.__format_score__(self.train_acc_score), self.__format_score__(self.val_acc_score),
+            self.n_nodes, self.height
+        ) + (' (raced out)' if self.raced_out else '')
+
+    @staticmethod
+    def __format_score__(score, decimals=3):
+        """
+        Formats an accuracy, which is None for partitions a raced-out individual was not scored on.
+        """
+
+        return '%0.*f' % (decimals, score) if score is not None else 'n/a'
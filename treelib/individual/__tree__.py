@@ -1,12 +1,21 @@
 # coding=utf-8
 
+import ast
 import collections
 import copy
+import ctypes
 import itertools as it
 import json
+import multiprocessing as mp
+import multiprocessing.sharedctypes
+import struct
+import StringIO
+import zlib
 from collections import Counter
 from sklearn.metrics import *
 from treelib.node import *
+from scorer import predict_arrays
+import scorer
 import networkx as nx
 import pandas as pd
 import operator as op
@@ -47,14 +56,54 @@ class DecisionTree(object):
 
     multi_tests = None
 
+    _drawn_labels = None  # type: np.ndarray
+    _random_state = None  # type: np.random.RandomState
+    _structure_hash = None  # type: int
+
+    n_split_evaluations = 0  # number of candidate thresholds evaluated while growing this tree
+
+    # serialized encodings (see pack_encoding): version, whether compressed, number of nodes and multi_tests
+    _packed_header = struct.Struct('<BBii')
+    _packed_version = 1
+
+    # racing: trees which cannot reach a cutoff are discarded before being scored on every row (see score)
+    race_block_size = 1000  # rows per block
+    race_delta = 0.05  # probability of discarding a tree which would reach the cutoff
+    raced_out = False  # whether this tree was discarded, in which case only its fitness is estimated
+
     def __init__(self, gm, **kwargs):
-        self.sample(gm)
+        if 'encoding' in kwargs and kwargs['encoding'] is not None:
+            self.decode(kwargs['encoding'])
+        else:
+            self.sample(
+                gm,
+                labels=kwargs['labels'] if 'labels' in kwargs else None,
+                random_state=kwargs['random_state'] if 'random_state' in kwargs else None,
+                cutoff=kwargs['cutoff'] if 'cutoff' in kwargs else None
+            )
 
     @classmethod
     def set_values(cls, **kwargs):
         for k, v in kwargs.iteritems():
             setattr(cls, k, v)
 
+    @classmethod
+    def set_train_rows(cls, train_rows):
+        """
+        Sets which rows of the dataset are used for growing and scoring trees (i.e. the train partition),
+        for instance a subsample of the training set.
+
+        :type train_rows: numpy.ndarray
+        :param train_rows: A boolean mask over the rows of the dataset.
+        """
+
+        arg_sets = dict(cls.arg_sets)
+        arg_sets['train'] = train_rows
+
+        cls.arg_sets = arg_sets
+        cls.y_train_true = cls.dataset.loc[train_rows, cls.dataset_info.target_attr]
+        cls.mdevice.set_arg_sets(arg_sets)
+
     def nodes_at_depth(self, depth):
         """
         Selects all nodes which are in the given level.
@@ -114,7 +163,27 @@ class DecisionTree(object):
 
         return len(self._shortest_path[node_id]) - 1
 
-    def sample(self, gm):
+    def sample(self, gm, labels=None, random_state=None, cutoff=None):
+        """
+        Samples a decision tree from the graphical model, and computes its fitness.
+
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Current graphical model.
+        :type labels: numpy.ndarray
+        :param labels: optional - a (nodes x multi_tests) array of labels already drawn from the graphical
+            model (see GraphicalModel.sample). If None, labels are drawn from gm as nodes are created.
+        :type random_state: numpy.random.RandomState
+        :param random_state: optional - generator for labels observed from gm while the tree is built. If None,
+            the generator of gm is used.
+        :type cutoff: float
+        :param cutoff: optional - fitness the tree must be able to reach in order to be scored on every row.
+            See DecisionTree.score.
+        """
+
+        self._drawn_labels = labels
+        self._random_state = random_state
+        self.n_split_evaluations = 0
+
         arg_threshold = DecisionTree.arg_sets['train']
 
         self.tree = self.tree = self.__set_node__(
@@ -129,20 +198,353 @@ class DecisionTree(object):
 
         self._shortest_path = nx.shortest_path(self.tree, source=0)  # source equals to root
 
-        predictions = np.array(self.mdevice.predict(self.mdevice.dataset, self, inner=True))
+        self.score(cutoff)
+
+        self.height = max(map(len, self._shortest_path.itervalues()))
+        self.n_nodes = len(self.tree.node)
+
+    def score(self, cutoff=None):
+        """
+        Computes the accuracy of this tree in each partition, and its fitness. The tree itself is not changed;
+        hence, trees grown on a subsample of the training set can be scored again on another one.
+
+        :type cutoff: float
+        :param cutoff: optional - if provided, the tree is first raced against it on blocks of training rows
+            (see Device.race). If it provably cannot reach cutoff, it is discarded: its fitness is estimated from
+            the rows visited so far, and it is not scored on other partitions.
+        """
+
+        self.raced_out = False
+
+        if cutoff is not None:
+            n_correct, n_seen = self.mdevice.race(
+                self, cutoff, block_size=DecisionTree.race_block_size, delta=DecisionTree.race_delta
+            )
+            if n_seen < self.mdevice.race_rows.shape[0]:
+                self.raced_out = True
+                self.train_acc_score = n_correct / float(n_seen)
+                self.val_acc_score, self.test_acc_score = None, None
+                self.fitness = self.train_acc_score
+                return
+
+        # only the number of hits per partition is needed; predictions themselves are never transferred
+        train_correct, val_correct, test_correct = self.mdevice.get_correct_counts(self)
+
+        self.train_acc_score = train_correct / float(DecisionTree.y_train_true.shape[0])
+        self.val_acc_score = val_correct / float(DecisionTree.y_val_true.shape[0])
+        self.test_acc_score = test_correct / float(DecisionTree.y_test_true.shape[0])
+
+        self.fitness = self.train_acc_score
+
+    def encode(self):
+        """
+        Converts this tree, and its scores, to a compact encoding of flat numpy arrays, with one position per
+        node, sorted by node id (i.e. heap order). Attributes are stored as their indices in the dataset; the
+        class of a terminal node is stored as its index in dataset_info.class_labels, in the first test.
+
+        :rtype: dict
+        :return: A dictionary with node_id, terminal, labels, thresholds, inst_correct, inst_total,
+            scores (train, val and test accuracies), n_split_evaluations and raced_out arrays.
+        """
+
+        node_ids = np.array(sorted(self.tree.node.keys()), dtype=np.int64)
+        n_nodes = node_ids.shape[0]
+        multi_tests = DecisionTree.multi_tests
+
+        terminal = np.zeros(n_nodes, dtype=np.bool)
+        labels = np.zeros((n_nodes, multi_tests), dtype=np.int32)
+        thresholds = np.zeros((n_nodes, multi_tests), dtype=np.float32)
+        inst_correct = np.empty(n_nodes, dtype=np.int64)
+        inst_total = np.empty(n_nodes, dtype=np.int64)
+
+        for i, node_id in enumerate(node_ids):
+            node = self.tree.node[node_id]
+            if node['terminal']:
+                terminal[i] = True
+                labels[i, 0] = DecisionTree.dataset_info.class_label_index[node['label']]
+            else:
+                labels[i] = [DecisionTree.dataset_info.attribute_index[x] for x in node['label']]
+                thresholds[i] = node['threshold']
+
+            inst_correct[i] = node['inst_correct']
+            inst_total[i] = node['inst_total']
+
+        return dict(
+            node_id=node_ids, terminal=terminal, labels=labels, thresholds=thresholds,
+            inst_correct=inst_correct, inst_total=inst_total,
+            scores=np.array([self.train_acc_score, self.val_acc_score, self.test_acc_score], dtype=np.float64),
+            n_split_evaluations=np.int64(self.n_split_evaluations),
+            raced_out=np.bool(self.raced_out)
+        )
+
+    @property
+    def structure_hash(self):
+        """
+        Hash of the structure of this tree (node ids, tested attributes and thresholds). Trees with the same
+        structure have the same hash.
+        """
+
+        if self._structure_hash is None:
+            encoding = self.encode()
+            self._structure_hash = hash(tuple(
+                encoding[k].tostring() for k in ['node_id', 'terminal', 'labels', 'thresholds']
+            ))
+        return self._structure_hash
+
+    @staticmethod
+    def __graph_from_encoding__(encoding, columns, class_labels):
+        """
+        Builds the graph of a tree from its encoding.
+
+        :type encoding: dict
+        :param encoding: The encoded tree, as returned by DecisionTree.encode.
+        :param columns: Names of the columns of the dataset, indexed as in the encoding.
+        :param class_labels: Class labels, indexed as in the encoding.
+        :rtype: networkx.DiGraph
+        :return: The tree, with the same node and edge attributes as sampled trees.
+        """
+
+        tree = nx.DiGraph()
 
-        self.train_acc_score = accuracy_score(DecisionTree.y_train_true, predictions[self.arg_sets['train']])
-        self.val_acc_score = accuracy_score(DecisionTree.y_val_true, predictions[self.arg_sets['val']])
-        self.test_acc_score = accuracy_score(DecisionTree.y_test_true, predictions[self.arg_sets['test']])
+        for i, node_id in enumerate(encoding['node_id']):
+            node_id = int(node_id)
+            level = get_depth(node_id)
+
+            if encoding['terminal'][i]:
+                meta = {
+                    'label': class_labels[encoding['labels'][i, 0]],
+                    'threshold': None,
+                    'terminal': True,
+                    'color': DecisionTree._terminal_node_color
+                }
+            else:
+                meta = {
+                    'label': [columns[x] for x in encoding['labels'][i]],
+                    'threshold': list(encoding['thresholds'][i]),
+                    'terminal': False,
+                    'color': DecisionTree._root_node_color if level == 0 else DecisionTree._inner_node_color
+                }
+
+            meta.update({
+                'inst_correct': encoding['inst_correct'][i],
+                'inst_total': encoding['inst_total'][i],
+                'level': level,
+                'node_id': node_id
+            })
+
+            tree.add_node(node_id, attr_dict=meta)
+
+        for node_id, node in tree.node.iteritems():
+            if not node['terminal']:
+                children_id = [get_left_child(node_id), get_right_child(node_id)]
+                for child_id, attr_dict in it.izip(children_id, DecisionTree.__edge_attributes__(node['threshold'])):
+                    tree.add_edge(node_id, child_id, attr_dict=attr_dict)
+
+        return tree
+
+    def decode(self, encoding):
+        """
+        Rebuilds this tree, and its scores, from an encoding returned by DecisionTree.encode, without
+        evaluating it again.
 
+        :type encoding: dict
+        :param encoding: The encoded tree.
+        """
+
+        self.tree = self.__graph_from_encoding__(
+            encoding, DecisionTree.dataset.columns, DecisionTree.dataset_info.class_labels
+        )
+        self._shortest_path = nx.shortest_path(self.tree, source=0)
+
+        self.train_acc_score, self.val_acc_score, self.test_acc_score = [float(x) for x in encoding['scores']]
         self.fitness = self.train_acc_score
+        self.n_split_evaluations = int(encoding['n_split_evaluations'])
+
+        self.raced_out = bool(encoding['raced_out']) if 'raced_out' in encoding else False
+        if self.raced_out:
+            self.val_acc_score, self.test_acc_score = None, None
 
         self.height = max(map(len, self._shortest_path.itervalues()))
         self.n_nodes = len(self.tree.node)
 
+    @staticmethod
+    def pack_encoding(encoding, compress=True):
+        """
+        Serializes an encoding, as returned by DecisionTree.encode, to a compact string of bytes: a fixed-size
+        header followed by the arrays of the encoding, in little-endian order and optionally compressed.
+
+        :type encoding: dict
+        :param encoding: The encoded tree.
+        :type compress: bool
+        :param compress: optional - whether to compress the arrays with zlib. Defaults to True.
+        :rtype: str
+        :return: The serialized encoding.
+        """
+
+        n_nodes, multi_tests = encoding['labels'].shape
+
+        body = ''.join([
+            np.asarray(encoding['node_id'], dtype='<i4').tostring(),
+            np.asarray(encoding['terminal'], dtype=np.uint8).tostring(),
+            np.asarray(encoding['labels'], dtype='<i4').tostring(),
+            np.asarray(encoding['thresholds'], dtype='<f4').tostring(),
+            np.asarray(encoding['inst_correct'], dtype='<i4').tostring(),
+            np.asarray(encoding['inst_total'], dtype='<i4').tostring(),
+            np.asarray(encoding['scores'], dtype='<f8').tostring(),
+            np.asarray([encoding['n_split_evaluations']], dtype='<i8').tostring(),
+            np.asarray([encoding['raced_out'] if 'raced_out' in encoding else False], dtype=np.uint8).tostring()
+        ])
+
+        if compress:
+            body = zlib.compress(body)
+
+        return DecisionTree._packed_header.pack(DecisionTree._packed_version, compress, n_nodes, multi_tests) + body
+
+    @staticmethod
+    def unpack_encoding(packed):
+        """
+        Deserializes an encoding serialized by DecisionTree.pack_encoding.
+
+        :type packed: str
+        :param packed: The serialized encoding.
+        :rtype: dict
+        :return: The encoded tree, as returned by DecisionTree.encode.
+        """
+
+        packed = str(packed)  # sqlite returns buffers
+
+        header = DecisionTree._packed_header
+        version, compressed, n_nodes, multi_tests = header.unpack(packed[:header.size])
+        if version != DecisionTree._packed_version:
+            raise ValueError('Unsupported tree encoding version: %d' % version)
+
+        body = packed[header.size:]
+        if compressed:
+            body = zlib.decompress(body)
+
+        fields = [
+            ('node_id', '<i4', (n_nodes,)), ('terminal', np.uint8, (n_nodes,)),
+            ('labels', '<i4', (n_nodes, multi_tests)), ('thresholds', '<f4', (n_nodes, multi_tests)),
+            ('inst_correct', '<i4', (n_nodes,)), ('inst_total', '<i4', (n_nodes,)),
+            ('scores', '<f8', (3,)), ('n_split_evaluations', '<i8', (1,)), ('raced_out', np.uint8, (1,))
+        ]
+
+        encoding = dict()
+        offset = 0
+        for name, dtype, shape in fields:
+            count = int(np.prod(shape))
+            encoding[name] = np.frombuffer(body, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset += count * np.dtype(dtype).itemsize
+
+        encoding['node_id'] = encoding['node_id'].astype(np.int64)
+        encoding['terminal'] = encoding['terminal'].astype(np.bool)
+        encoding['n_split_evaluations'] = np.int64(encoding['n_split_evaluations'][0])
+        encoding['raced_out'] = np.bool(encoding['raced_out'][0])
+
+        return encoding
+
+    @staticmethod
+    def encoding_to_dot(encoding, columns, class_labels):
+        """
+        Renders an encoded tree in the DOT language, without the dataset it was induced from. The output is
+        the same as Individual.to_dot.
+
+        :type encoding: dict
+        :param encoding: The encoded tree, as returned by DecisionTree.encode.
+        :param columns: Names of the columns of the dataset, in order.
+        :param class_labels: Class labels, sorted (see MetaDataset.class_labels).
+        :rtype: str
+        :return: The tree, in the DOT language.
+        """
+
+        output = StringIO.StringIO()
+        nx.drawing.nx_pydot.write_dot(DecisionTree.__graph_from_encoding__(encoding, columns, class_labels), output)
+        _str = output.getvalue()
+        output.close()
+        return _str
+
     def predict(self, samples):
         return self.mdevice.predict(samples, self, inner=False)
 
+    def predict_array(self, data, arrays=None, n_jobs=1):
+        """
+        Makes predictions for a numpy array of unseen samples, without converting it to python objects.
+
+        :type data: numpy.ndarray
+        :param data: A two-dimensional array where each row is an object, and predictive attributes are in
+            the same order as in the training set.
+        :type arrays: dict
+        :param arrays: optional - this tree, as returned by to_arrays. Saves the conversion cost when
+            predicting several batches in a row.
+        :type n_jobs: int
+        :param n_jobs: optional - number of processes to use. -1 uses all cores. Defaults to 1.
+        :rtype: numpy.ndarray
+        :return: An array with the predicted class labels.
+        """
+
+        if arrays is None:
+            arrays = self.to_arrays()
+
+        if n_jobs == 1:
+            predictions = predict_arrays(data, arrays)
+        else:
+            predictions = predict_arrays_parallel(data, arrays, n_jobs)
+
+        return DecisionTree.dataset_info.class_labels[predictions]
+
+    def save(self, path):
+        """
+        Writes this tree to a compact model file, which can be loaded with scorer.Model.load
+        without importing treelib.
+
+        :type path: str
+        :param path: Path to the model file.
+        """
+
+        scorer.save(
+            path, self.to_arrays(),
+            attributes=DecisionTree.dataset_info.pred_attr,
+            class_labels=DecisionTree.dataset_info.class_labels
+        )
+
+    def to_arrays(self):
+        """
+        Converts the inner decision tree from this class to flat numpy arrays, with one position per node
+        (root at position zero). Attributes are stored as their indices in the dataset, and class labels
+        as their indices in dataset_info.class_labels.
+
+        :rtype: dict
+        :return: A dictionary with left, right, terminal, attributes, thresholds and classes arrays.
+        """
+
+        tree = self.tree
+        multi_tests = DecisionTree.multi_tests
+
+        conv_dict = {k: i for i, k in enumerate(sorted(tree.node.keys()))}
+        n_nodes = len(conv_dict)
+
+        left = np.full(n_nodes, -1, dtype=np.int32)
+        right = np.full(n_nodes, -1, dtype=np.int32)
+        terminal = np.zeros(n_nodes, dtype=np.bool)
+        attributes = np.zeros((n_nodes, multi_tests), dtype=np.int32)
+        thresholds = np.zeros((n_nodes, multi_tests), dtype=np.float32)
+        classes = np.full(n_nodes, -1, dtype=np.int32)
+
+        for node_id, node in tree.node.iteritems():
+            i = conv_dict[node_id]
+            if node['terminal']:
+                terminal[i] = True
+                classes[i] = DecisionTree.dataset_info.class_label_index[node['label']]
+            else:
+                left[i] = conv_dict[get_left_child(node_id)]
+                right[i] = conv_dict[get_right_child(node_id)]
+                attributes[i] = [DecisionTree.dataset_info.attribute_index[x] for x in node['label']]
+                thresholds[i] = node['threshold']
+
+        return dict(
+            left=left, right=right, terminal=terminal, attributes=attributes, thresholds=thresholds, classes=classes
+        )
+
     def to_matrix(self):
         """
         Converts the inner decision tree from this class to a matrix with n_nodes
@@ -207,7 +609,10 @@ class DecisionTree(object):
 
     def __set_node__(self, node_id, gm, tree, subset_index, depth, parent_labels, coordinates):
         try:
-            label = gm.observe(node_id=node_id)
+            if self._drawn_labels is not None and node_id in gm.node_index:
+                label = gm.labels[self._drawn_labels[gm.node_index[node_id]]]
+            else:
+                label = gm.observe(node_id=node_id, random_state=self._random_state)
         except KeyError as ke:
             if depth >= gm.D:
                 label = DecisionTree.dataset_info.target_attr
@@ -271,31 +676,43 @@ class DecisionTree(object):
                     )
 
                 else:
-                    if type(meta['threshold']) in [np.float32, np.float64, float]:  # TODO use raw_type_dict
-                        attr_dicts = [
-                            {'threshold': '<= %0.2f' % meta['threshold']},
-                            {'threshold': '> %0.2f' % meta['threshold']}
-                        ]
-                    elif isinstance(meta['threshold'], collections.Iterable):
-                        dict_left, dict_right = dict(threshold=''), dict(threshold='')
-                        for thres in meta['threshold']:
-                            if type(thres) in [np.float32, np.float64, float]:
-                                dict_left['threshold'] += ' ' + '<= %0.2f\n' % thres
-                                dict_right['threshold'] += ' ' + '> %02.f\n' % thres
-                            else:
-                                dict_left['threshold'] += ' ' + '!= %s\n' % thres
-                                dict_right['threshold'] += ' ' + '== %s\n' % thres
-
-                        attr_dicts = [dict_left, dict_right]
-                    else:
-                        raise TypeError('invalid type for threshold!')
-
-                    for child_id, attr_dict in it.izip(children_id, attr_dicts):
+                    for child_id, attr_dict in it.izip(children_id, self.__edge_attributes__(meta['threshold'])):
                         tree.add_edge(node_id, child_id, attr_dict=attr_dict)
 
         tree.add_node(node_id, attr_dict=meta)
         return tree
 
+    @staticmethod
+    def __edge_attributes__(threshold):
+        """
+        Describes the tests of an inner node, for drawing its edges.
+
+        :param threshold: Threshold of the inner node, either a single value or one value per test.
+        :rtype: list
+        :return: A list with the attributes of the left and right edges.
+        """
+
+        if type(threshold) in [np.float32, np.float64, float]:  # TODO use raw_type_dict
+            attr_dicts = [
+                {'threshold': '<= %0.2f' % threshold},
+                {'threshold': '> %0.2f' % threshold}
+            ]
+        elif isinstance(threshold, collections.Iterable):
+            dict_left, dict_right = dict(threshold=''), dict(threshold='')
+            for thres in threshold:
+                if type(thres) in [np.float32, np.float64, float]:
+                    dict_left['threshold'] += ' ' + '<= %0.2f\n' % thres
+                    dict_right['threshold'] += ' ' + '> %02.f\n' % thres
+                else:
+                    dict_left['threshold'] += ' ' + '!= %s\n' % thres
+                    dict_right['threshold'] += ' ' + '== %s\n' % thres
+
+            attr_dicts = [dict_left, dict_right]
+        else:
+            raise TypeError('invalid type for threshold!')
+
+        return attr_dicts
+
     def __predict_object__(self, obj):
         arg_node = 0  # always start with root
 
@@ -387,6 +804,7 @@ class DecisionTree(object):
                 [(a + b) / 2. for a, b in it.izip(unique_vals[::2], unique_vals[1::2])], dtype=np.float32
             )
             gains = self.mdevice.get_gain_ratios(subset_index, node_label, candidates)
+            self.n_split_evaluations += candidates.shape[0]
 
             argmax = np.argmax(gains)
 
@@ -498,14 +916,101 @@ class DecisionTree(object):
         return j
 
     def from_json(self, json_string):
+        """
+        Rebuilds this tree from a string returned by DecisionTree.to_json. Scores are not stored in the string;
+        call DecisionTree.score to evaluate the rebuilt tree.
+
+        :type json_string: str
+        :param json_string: The tree, as returned by DecisionTree.to_json.
+        """
+
         j = json.loads(json_string)
-        raise NotImplementedError('not implemented yet!')
+
+        tree = nx.DiGraph()
+        for node_id, node in j['nodes'].iteritems():
+            node = dict(node)
+            node['threshold'] = ast.literal_eval(node['threshold'])  # to_json writes thresholds as strings
+            tree.add_node(int(node_id), attr_dict=node)
+
+        for node_id, successors in j['edges'].iteritems():
+            for child_id, attr_dict in successors.iteritems():
+                tree.add_edge(int(node_id), int(child_id), attr_dict=attr_dict)
+
+        self.tree = tree
+        self._shortest_path = nx.shortest_path(self.tree, source=0)
+        self.height = max(map(len, self._shortest_path.itervalues()))
+        self.n_nodes = len(self.tree.node)
 
     def to_json(self):
         j = self.to_dict()
 
-        for k in j['nodes'].iterkeys():
-            j['nodes'][k]['threshold'] = str(j['nodes'][k]['threshold'])
+        # nodes are copied, so that thresholds of this tree are not replaced by their strings
+        j['nodes'] = {k: dict(node, threshold=str(node['threshold'])) for k, node in j['nodes'].iteritems()}
 
         _str = json.dumps(j, ensure_ascii=False, indent=2)
         return _str
+
+
+def __predict_range__(data, predictions, arrays, start, stop, chunk_size):
+    """
+    Worker function for predict_arrays_parallel. Writes predictions for rows [start, stop) directly
+    into the shared predictions array.
+    """
+
+    for chunk_start in xrange(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        predictions[chunk_start:chunk_stop] = predict_arrays(
+            np.asarray(data[chunk_start:chunk_stop], dtype=np.float32), arrays
+        )
+
+
+def predict_arrays_parallel(data, arrays, n_jobs=-1, chunk_size=65536):
+    """
+    Makes predictions for a large batch of objects with several processes. Input and output reside in
+    shared memory (the input may also be a numpy.memmap), and each process scores a disjoint range of rows;
+    hence, no rows are pickled between processes.
+
+    :param data: A two-dimensional numpy.ndarray, numpy.memmap or pandas.DataFrame where each row is an object.
+    :type arrays: dict
+    :param arrays: A decision tree, as returned by DecisionTree.to_arrays.
+    :type n_jobs: int
+    :param n_jobs: optional - number of processes. -1 uses all cores. Defaults to -1.
+    :type chunk_size: int
+    :param chunk_size: optional - number of rows each process scores at once. Defaults to 65536.
+    :rtype: numpy.ndarray
+    :return: The index of the predicted class for each one of the objects.
+    """
+
+    if n_jobs == -1:
+        n_jobs = mp.cpu_count()
+
+    if isinstance(data, pd.DataFrame):
+        data = data.values
+
+    n_objects, n_attributes = data.shape
+
+    if not isinstance(data, np.memmap):  # copies input to shared memory; memory-mapped files are already shared
+        shared_data = mp.sharedctypes.RawArray(ctypes.c_float, n_objects * n_attributes)
+        _data = np.frombuffer(shared_data, dtype=np.float32).reshape(n_objects, n_attributes)
+        _data[:] = data
+        data = _data
+
+    shared_predictions = mp.sharedctypes.RawArray(ctypes.c_int32, n_objects)
+    predictions = np.frombuffer(shared_predictions, dtype=np.int32)
+
+    bounds = np.linspace(0, n_objects, n_jobs + 1).astype(np.int64)
+
+    processes = []
+    for start, stop in it.izip(bounds[:-1], bounds[1:]):
+        if start == stop:
+            continue
+
+        p = mp.Process(target=__predict_range__, args=(data, predictions, arrays, start, stop, chunk_size))
+        p.start()
+        processes += [p]
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0, RuntimeError('A worker process failed while making predictions!')
+
+    return predictions.copy()
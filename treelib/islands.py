@@ -0,0 +1,209 @@
+# coding=utf-8
+
+"""
+Island model for Ardennes: several populations, each one with its own graphical model, evolve in separate
+processes and periodically send copies of their best individuals to each other. Islands never wait for each
+other; migrants are sent and received without blocking, so islands which are slower do not stall the others.
+"""
+
+import multiprocessing as mp
+import Queue
+
+import numpy as np
+
+from treelib import Ardennes
+from treelib.individual import Individual
+from treelib.utils import spawn_random_states
+
+__author__ = 'Henry Cagnini'
+
+
+class Island(Ardennes):
+    topologies = ['ring', 'fully_connected', 'random']
+
+    def __init__(self, n_individuals, n_iterations, max_height=3, **kwargs):
+        """
+
+        :type n_individuals: int
+        :param n_individuals: Number of individuals in this island.
+        :type n_iterations: int
+        :param n_iterations: Number of iterations of this island.
+        :type max_height: int
+        :param max_height: Maximum height of trees.
+        :param kwargs: island_id (index of this island), inboxes (a list with one multiprocessing.Queue per
+            island), migration_interval (number of generations between migrations), n_migrants (number of
+            individuals sent per migration) and topology (one of Island.topologies).
+        """
+
+        super(Island, self).__init__(n_individuals=n_individuals, n_iterations=n_iterations, max_height=max_height)
+
+        self.island_id = kwargs['island_id']
+        self.inboxes = kwargs['inboxes']
+        self.migration_interval = kwargs['migration_interval'] if 'migration_interval' in kwargs else 5
+        self.n_migrants = kwargs['n_migrants'] if 'n_migrants' in kwargs else 1
+        self.topology = kwargs['topology'] if 'topology' in kwargs else 'ring'
+
+        assert self.topology in Island.topologies, ValueError('topology must be one of %s!' % Island.topologies)
+
+    def __destinations__(self):
+        """
+        :rtype: list
+        :return: Indexes of the islands which receive migrants from this one.
+        """
+
+        n_islands = len(self.inboxes)
+        others = [i for i in xrange(n_islands) if i != self.island_id]
+
+        if len(others) == 0:
+            return []
+        if self.topology == 'ring':
+            return [(self.island_id + 1) % n_islands]
+        if self.topology == 'fully_connected':
+            return others
+        return [others[self.random_state.randint(len(others))]]  # random
+
+    def __migrate__(self, iteration, gm, population, scores):
+        if (iteration + 1) % self.migration_interval != 0:
+            return scores, population
+
+        encodings = [ind.encode() for ind in population[:self.n_migrants]]
+        for destination in self.__destinations__():
+            self.inboxes[destination].put(encodings)
+
+        immigrants = []
+        while True:
+            try:
+                immigrants += self.inboxes[self.island_id].get_nowait()
+            except Queue.Empty:
+                break
+
+        # immigrants replace the worst individuals, and are scored again on the training rows of this island
+        immigrants = immigrants[:self.n_individuals - self.n_migrants]
+        for j, encoding in enumerate(immigrants):
+            i = self.n_individuals - 1 - j
+            ind = Individual(ind_id=population[i].ind_id, gm=None, iteration=iteration, encoding=encoding)
+            ind.score()
+            population[i] = ind
+            scores[i] = Individual.scores_of([ind])[0]
+
+        order = Individual.rank(scores)
+        return scores[order], population[order]
+
+
+def __run_island__(island_kwargs, train_df, decile, fit_kwargs, results):
+    """
+    Target of each island process. Evolves an island, and sends its final population to the parent process.
+    """
+
+    island = Island(**island_kwargs)
+
+    # migrants left in the inboxes of islands which already finished are discarded
+    for inbox in island.inboxes:
+        inbox.cancel_join_thread()
+
+    island.fit(train_df=train_df, decile=decile, **fit_kwargs)
+
+    results.put((island.island_id, [ind.encode() for ind in island.population], island.history))
+
+
+class Archipelago(object):
+    def __init__(self, n_islands, n_individuals, n_iterations, max_height=3, migration_interval=5, n_migrants=1,
+                 topology='ring'):
+        """
+
+        :type n_islands: int
+        :param n_islands: Number of islands, each one evolved by its own process. -1 uses one island per core.
+        :type n_individuals: int
+        :param n_individuals: Number of individuals in each island.
+        :type n_iterations: int
+        :param n_iterations: Number of iterations of each island.
+        :type max_height: int
+        :param max_height: Maximum height of trees.
+        :type migration_interval: int
+        :param migration_interval: Number of generations between migrations.
+        :type n_migrants: int
+        :param n_migrants: Number of best individuals which each island sends per migration.
+        :type topology: str
+        :param topology: Which islands receive migrants from each island: the next one ('ring'), every other
+            one ('fully_connected') or another one drawn at random at each migration ('random').
+        """
+
+        assert topology in Island.topologies, ValueError('topology must be one of %s!' % Island.topologies)
+
+        self.n_islands = n_islands if n_islands != -1 else mp.cpu_count()
+        self.n_individuals = n_individuals
+        self.n_iterations = n_iterations
+        self.max_height = max_height
+        self.migration_interval = migration_interval
+        self.n_migrants = n_migrants
+        self.topology = topology
+
+        self.trained = False
+        self.predictor = None
+        self.population = None
+        self.histories = None
+
+    def fit(self, train_df, decile, verbose=False, **kwargs):
+        """
+        Evolves every island. Since migration is asynchronous, runs are not reproducible, even with random_state.
+
+        Optional keyword arguments are the ones of Ardennes.fit, and are passed to every island; random_state
+        is used as the root seed of the islands, and each island writes its own checkpoint, suffixed by its index.
+        """
+
+        # sets up decision trees in this process too, so that the final populations can be rebuilt here
+        local = Ardennes(n_individuals=self.n_individuals, n_iterations=self.n_iterations, max_height=self.max_height)
+        local.__setup__(train_df, **dict(kwargs, dbhandler=None))
+
+        random_state = kwargs['random_state'] if 'random_state' in kwargs else None
+        seeds = [int(x.randint(0, 2 ** 32, dtype=np.uint64)) for x in spawn_random_states(random_state, self.n_islands)]
+
+        inboxes = [mp.Queue() for _ in xrange(self.n_islands)]
+        results = mp.Queue()
+
+        processes = []
+        for island_id in xrange(self.n_islands):
+            island_kwargs = dict(
+                n_individuals=self.n_individuals, n_iterations=self.n_iterations, max_height=self.max_height,
+                island_id=island_id, inboxes=inboxes, migration_interval=self.migration_interval,
+                n_migrants=self.n_migrants, topology=self.topology
+            )
+            fit_kwargs = dict(kwargs, verbose=verbose, random_state=seeds[island_id])
+            if 'checkpoint_path' in kwargs and kwargs['checkpoint_path'] is not None:
+                fit_kwargs['checkpoint_path'] = '%s.%d' % (kwargs['checkpoint_path'], island_id)
+
+            p = mp.Process(target=__run_island__, args=(island_kwargs, train_df, decile, fit_kwargs, results))
+            p.start()
+            processes += [p]
+
+        outcomes = sorted([results.get() for _ in processes])  # reads results before joining, to avoid deadlocks
+        for p in processes:
+            p.join()
+            assert p.exitcode == 0, RuntimeError('An island process failed!')
+
+        population = []
+        for island_id, encodings, history in outcomes:
+            population += [
+                Individual(ind_id=i, gm=None, iteration=None, encoding=e) for i, e in enumerate(encodings)
+            ]
+        population = np.array(population, dtype=Individual)
+
+        scores = Individual.scores_of(population)
+        order = Individual.rank(scores)
+
+        self.population = population[order]  # every island, sorted from best to worst individual
+        self.histories = [history for island_id, encodings, history in outcomes]
+        self.predictor = Ardennes.get_best_individual(self.population, scores[order])
+        self.trained = True
+
+    def predict(self, test_set):
+        """
+        Makes predictions for unseen data, with the best individual among all islands.
+
+        :type test_set: pandas.DataFrame
+        :param test_set: Unseen data, with the same predictive attributes as the training set.
+        :rtype: list
+        :return: A list of predicted class labels.
+        """
+
+        return list(self.predictor.predict(test_set))
@@ -1,9 +1,15 @@
 # coding=utf-8
 
+import binascii
+import Queue
+import sys
+import threading
 import numpy as np
 import sqlite3
+import itertools as it
 
 from treelib import get_total_nodes
+from treelib.individual import DecisionTree
 from matplotlib import pyplot as plt
 import pandas as pd
 
@@ -20,10 +26,60 @@ class DatabaseHandler(object):
 
     modes = ['holdout', 'cross-validation']
 
-    commit_every = 10  # commits data at every N generations
+    compress_trees = True  # whether trees in the POPULATION table are compressed (see DecisionTree.pack_encoding)
+
+    # applied to every connection; page_size must come first, since it only takes effect before the
+    # database is created (and can not be changed in WAL mode)
+    pragmas = [
+        ('page_size', 8192),
+        ('journal_mode', 'WAL'),  # readers do not block the writer, and commits only append to the log
+        ('synchronous', 'NORMAL'),  # in WAL mode, a crash may lose the last transactions, but never corrupts
+        ('cache_size', -16384),  # in KiB
+        ('temp_store', 'MEMORY')
+    ]
+
+    # version of the schema, stored in the user_version pragma of the database. Databases written with older
+    # versions are upgraded when opened (see DatabaseHandler.__upgrade_schema__)
+    schema_version = 2
+
+    # prototype is stored in long format: only nodes materialized by the model, and only their
+    # labels with non-zero probability, are written. Node -1 is the prior of non-materialized nodes;
+    # a NULL attribute holds the probability of each attribute not listed for that node
+    prototype_table = """
+      CREATE TABLE IF NOT EXISTS PROTOTYPE (
+        id_run INTEGER NOT NULL,
+        iteration INTEGER NOT NULL,
+        node INTEGER NOT NULL,
+        attribute TEXT DEFAULT NULL,
+        probability REAL NOT NULL,
+        FOREIGN KEY (id_run) REFERENCES RUNS(id_run),
+        FOREIGN KEY (attribute) REFERENCES ATTRIBUTES(attribute),
+        CONSTRAINT unique_columns_prototype UNIQUE (id_run, iteration, node, attribute)
+      );
+    """
+
+    # what write_generation does when the queue of the background writer is full: either wait for the
+    # writer to catch up, or discard the snapshot of that generation
+    writer_policies = ['block', 'drop']
 
     def __init__(self, path, dataset_name=None, mode=None, n_runs=None, n_individuals=None,
-                 n_iterations=None, tree_height=None, decile=None, multi_tests=None, random_state=None):
+                 n_iterations=None, tree_height=None, decile=None, multi_tests=None, random_state=None,
+                 background=False, queue_size=4, policy='block'):
+        """
+
+        Other parameters describe the evolution, and are only used when the database is created.
+
+        :type path: str
+        :param path: Path to the database file.
+        :type background: bool
+        :param background: optional - whether write_generation should hand generations to a dedicated writer
+            thread, instead of writing them before returning. Defaults to False.
+        :type queue_size: int
+        :param queue_size: optional - maximum number of generations waiting to be written by the background
+            writer. Defaults to 4.
+        :type policy: str
+        :param policy: optional - either 'block' or 'drop' (see DatabaseHandler.writer_policies). Defaults to 'block'.
+        """
 
         self.path = path
 
@@ -37,11 +93,16 @@ class DatabaseHandler(object):
         self.attributes = None
         self.dataset_name = dataset_name
 
-        # TODO resume evolution!
-
-        self._conn = sqlite3.connect(path)
+        # the background writer uses the connection from its own thread; the main thread only touches it
+        # again once the writer is idle (see DatabaseHandler.flush)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
         cursor = self._conn.cursor()
 
+        for name, value in DatabaseHandler.pragmas:
+            cursor.execute('PRAGMA %s = %s;' % (name, value))
+
+        self.__upgrade_schema__()
+
         cursor.execute("""
           CREATE TABLE IF NOT EXISTS EVALUATION_MODES (
             mode TEXT NOT NULL PRIMARY KEY
@@ -110,38 +171,35 @@ class DatabaseHandler(object):
             train_correct INTEGER NOT NULL,
             val_correct INTEGER DEFAULT NULL,
             test_correct INTEGER DEFAULT NULL,
-            dot TEXT DEFAULT NULL,
+            tree BLOB DEFAULT NULL,
             FOREIGN KEY(id_run) REFERENCES RUNS(id_run),
             CONSTRAINT unique_columns_population UNIQUE (id_run, iteration, individual)
           );
         """)
 
+        # class labels, sorted, so that trees stored in the POPULATION table can be rendered (see get_dot)
+        cursor.execute("""
+          CREATE TABLE IF NOT EXISTS CLASSES (
+            dataset_name TEXT NOT NULL,
+            class_index INTEGER NOT NULL,
+            class_label TEXT NOT NULL,
+            FOREIGN KEY (dataset_name) REFERENCES EVOLUTION(dataset_name),
+            CONSTRAINT unique_columns_classes PRIMARY KEY (dataset_name, class_index)
+          );
+        """)
+
+        cursor.execute(DatabaseHandler.prototype_table)
+
         cursor.execute("""SELECT COUNT(*) FROM EVOLUTION;""")
         count = cursor.fetchone()[0]
         if count == 0:
             max_n_nodes = get_total_nodes(tree_height - 1)  # max nodes a tree can have
-            n_variables = get_total_nodes(tree_height - 2)  # useful variables in the prototype tree
-
-            _prototype_columns_insert = ', '.join(['NODE_%d REAL NOT NULL' % i for i in xrange(n_variables)])
-            self._prototype_columns = ', '.join(['NODE_%d' % i for i in xrange(n_variables)])
 
             for p_mode in DatabaseHandler.modes:
                 cursor.execute("""
                   INSERT INTO EVALUATION_MODES (mode) VALUES ('%s')
                 """ % p_mode)
 
-            cursor.execute("""
-              CREATE TABLE IF NOT EXISTS PROTOTYPE (
-                id_run INTEGER NOT NULL,
-                iteration INTEGER NOT NULL,
-                attribute TEXT NOT NULL,
-                %s,
-                FOREIGN KEY (id_run) REFERENCES RUNS(id_run),
-                FOREIGN KEY (attribute) REFERENCES ATTRIBUTES(attribute),
-                CONSTRAINT unique_columns_prototype UNIQUE (id_run, iteration, attribute)
-               )
-             """ % _prototype_columns_insert)
-
             evolution_columns = (dataset_name, mode, n_runs, n_individuals, n_iterations, tree_height, max_n_nodes, decile, random_state)
             cursor.execute("""
               INSERT INTO EVOLUTION (id_evolution, dataset_name, mode, n_runs, n_individuals,
@@ -164,24 +222,196 @@ class DatabaseHandler(object):
             for relation_name, hashkey in rows:
                 exec('self.%s_hash = %d' % (relation_name, hashkey))
 
+        self.n_dropped = 0  # generations discarded by the background writer, under the 'drop' policy
+        self._policy = None
+        self._queue = None
+        self._writer = None
+        self._writer_error = None
+
+        if background:
+            self.__start_writer__(queue_size, policy)
+
         self.closed = False
 
+    def __upgrade_schema__(self):
+        """
+        Upgrades a database written with an older schema, in a single transaction, and sets its version to
+        DatabaseHandler.schema_version. Versions are:
+
+        0. one PROTOTYPE column per node (or no tables at all, if the database is new);
+        1. PROTOTYPE in long format;
+        2. trees in POPULATION stored as packed encodings (tree column), instead of DOT text (dot column).
+        """
+
+        cursor = self._conn.cursor()
+        version = cursor.execute('PRAGMA user_version;').fetchone()[0]
+
+        if version > DatabaseHandler.schema_version:
+            raise ValueError(
+                'Database %s has schema version %d, but this version of DatabaseHandler only supports up to %d!' % (
+                    self.path, version, DatabaseHandler.schema_version
+                )
+            )
+
+        if version < DatabaseHandler.schema_version:
+            isolation_level = self._conn.isolation_level
+            self._conn.isolation_level = None  # otherwise, sqlite3 commits before each ALTER, CREATE and DROP
+            try:
+                cursor.execute('BEGIN;')
+                if version < 1:
+                    self.__upgrade_prototype__(cursor)
+                if version < 2:
+                    self.__upgrade_population__(cursor)
+                cursor.execute('PRAGMA user_version = %d;' % DatabaseHandler.schema_version)
+                cursor.execute('COMMIT;')
+            except:
+                cursor.execute('ROLLBACK;')
+                raise
+            finally:
+                self._conn.isolation_level = isolation_level
+
+        cursor.close()
+
+    def __upgrade_prototype__(self, cursor):
+        """
+        Converts a PROTOTYPE table with one column per node (NODE_0, NODE_1, ...) to long format. Every node
+        was listed, so no row for the default prior (node -1) is needed.
+        """
+
+        columns = [x[DatabaseHandler.table_info_columns['name']] for x in cursor.execute(
+            'PRAGMA table_info(PROTOTYPE);'
+        ).fetchall()]
+
+        if len(columns) == 0 or 'node' in columns:  # no table yet, or already in long format
+            return
+
+        cursor.execute('ALTER TABLE PROTOTYPE RENAME TO PROTOTYPE_WIDE;')
+        cursor.execute(DatabaseHandler.prototype_table)
+
+        for column in columns:
+            if column.upper().startswith('NODE_'):
+                cursor.execute("""
+                  INSERT INTO PROTOTYPE (id_run, iteration, node, attribute, probability)
+                  SELECT id_run, iteration, %d, attribute, %s FROM PROTOTYPE_WIDE WHERE %s > 0;
+                """ % (int(column[len('NODE_'):]), column, column))
+
+        cursor.execute('DROP TABLE PROTOTYPE_WIDE;')
+
+    def __upgrade_population__(self, cursor):
+        """
+        Adds the tree column to a POPULATION table which only has the dot column. DOT text can not be converted
+        back to encodings, so older rows keep it, and DatabaseHandler.get_dot returns it as stored.
+        """
+
+        columns = [x[DatabaseHandler.table_info_columns['name']] for x in cursor.execute(
+            'PRAGMA table_info(POPULATION);'
+        ).fetchall()]
+
+        if len(columns) > 0 and 'tree' not in columns:
+            cursor.execute('ALTER TABLE POPULATION ADD COLUMN tree BLOB DEFAULT NULL;')
+
     def set_run(self, run):
         self._run = run
 
+    def has_run(self):
+        """
+        Whether the sets of the current run were already written, e.g. because this database was opened by an
+        evolution which is now resumed.
+        """
+
+        return self._id_run is not None
+
+    def resume(self, iteration):
+        """
+        Prepares this database for resuming the evolution of the current run from a checkpoint. Generations
+        logged after the checkpoint was written are deleted, since they are sampled again. With a background
+        writer, generations which were still queued when the evolution was interrupted are lost.
+
+        :type iteration: int
+        :param iteration: Iteration from which the evolution continues.
+        """
+
+        self.flush()
+
+        with self._conn:
+            for table in ['POPULATION', 'PROTOTYPE']:
+                self._conn.execute(
+                    """DELETE FROM %s WHERE id_run = ? AND iteration >= ?""" % table, (self._id_run, int(iteration))
+                )
+
     def get_cursor(self):
         return self._conn.cursor()
 
     def close(self):
+        """
+        Writes every generation still queued for the background writer, stops it, and closes the database.
+        """
+
+        if self._writer is not None:
+            self._queue.put(None)  # generations are written in order, so the writer stops after the last one
+            self._writer.join()
+            self._writer = None
+            self._queue = None
+
         if self._conn is not None and not self.closed:
             self._conn.commit()
             self._conn.close()
         self.closed = True
 
+        self.__raise_writer_error__()
+
     def commit(self):
         if not self.closed:
+            self.flush()
             self._conn.commit()
 
+    def flush(self):
+        """
+        Waits until the background writer has written every queued generation. Must be called before using
+        the connection from the main thread while the evolution is still logging.
+        """
+
+        if self._writer is not None:
+            self._queue.join()
+        self.__raise_writer_error__()
+
+    def __start_writer__(self, queue_size, policy):
+        assert policy in DatabaseHandler.writer_policies, ValueError(
+            'policy must be one of %s!' % str(DatabaseHandler.writer_policies)
+        )
+        assert queue_size > 0, ValueError('queue_size must be a positive integer!')
+
+        self._policy = policy
+        self._queue = Queue.Queue(maxsize=queue_size)
+
+        # a daemon, so that an interrupted evolution does not hang on exit; close() flushes it
+        self._writer = threading.Thread(target=self.__write_loop__, name='DatabaseHandler writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def __write_loop__(self):
+        while True:
+            snapshot = self._queue.get()
+            try:
+                if snapshot is None:
+                    return
+                if self._writer_error is None:  # after a failed write, the remaining generations are discarded
+                    self.__insert_generation__(*snapshot)
+            except Exception:
+                self._writer_error = sys.exc_info()
+            finally:
+                self._queue.task_done()
+
+    def __raise_writer_error__(self):
+        """
+        Re-raises, in the main thread, an exception raised by the background writer.
+        """
+
+        if self._writer_error is not None:
+            exc_type, exc_value, exc_traceback = self._writer_error
+            self._writer_error = None
+            raise exc_type, exc_value, exc_traceback
+
     @staticmethod
     def get_hash(dataset):
         return hash(tuple(dataset.apply(lambda x: hash(tuple(x)), axis=1)))
@@ -189,15 +419,28 @@ class DatabaseHandler(object):
     def write_attributes(self, attributes):
         cursor = self._conn.cursor()
 
-        for attribute in attributes:
-            cursor.execute("""
-                INSERT INTO ATTRIBUTES (dataset_name, attribute) VALUES ('%s', '%s')
-              """ % (self.dataset_name, attribute)
-            )
+        cursor.executemany(
+            """INSERT INTO ATTRIBUTES (dataset_name, attribute) VALUES (?, ?)""",
+            [(self.dataset_name, str(attribute)) for attribute in attributes]
+        )
 
         self.attributes = attributes
         cursor.close()
 
+    def write_classes(self, class_labels):
+        """
+        :param class_labels: Class labels of the dataset, sorted (see MetaDataset.class_labels).
+        """
+
+        cursor = self._conn.cursor()
+
+        cursor.executemany(
+            """INSERT INTO CLASSES (dataset_name, class_index, class_label) VALUES (?, ?, ?)""",
+            [(self.dataset_name, i, str(label)) for i, label in enumerate(class_labels)]
+        )
+
+        cursor.close()
+
     def write_sets(self, data):
         cursor = self._conn.cursor()
 
@@ -228,50 +471,188 @@ class DatabaseHandler(object):
 
         cursor.close()
 
-    def write_population(self, iteration, population):
-        cursor = self._conn.cursor()
+    def write_generation(self, iteration, gm, population):
+        """
+        Writes the graphical model and the population of a generation in a single transaction, which is
+        committed at the end; if any write fails, nothing from that generation is written.
 
-        for ind in population:
-
-            _string_insert = """
-              INSERT INTO POPULATION (
-                id_run, iteration, individual, fitness, height, n_nodes, train_correct, val_correct, test_correct, dot
-                ) VALUES (%d, %d, %d, %f, %d, %d, %d, %s, %s, '%s')""" % (
-                self._id_run, iteration, ind.ind_id, ind.fitness, ind.height, ind.n_nodes,
-                int(ind.train_acc_score * len(ind.y_train_true)),
-                str(int(ind.val_acc_score * len(ind.y_val_true))) if self.val_hash is not None else 'NULL',
-                str(int(ind.test_acc_score * len(ind.y_test_true))) if self.test_hash is not None else 'NULL',
-                ind.to_dot().replace("""'""", """''""")
-                )
+        With a background writer, only a snapshot of the generation is taken here (the rows to be written,
+        which do not change once taken), and the writer thread does the disk I/O while the evolution
+        proceeds. If the queue of the writer is full, this method either waits for it or discards the
+        generation, as set by the policy of the handler.
+
+        :type iteration: int
+        :param iteration: Current iteration.
+        :type gm: treelib.graphical_model.GraphicalModel
+        :param gm: Current graphical model.
+        :type population: numpy.ndarray
+        :param population: Current population.
+        """
+
+        snapshot = (self.__prototype_rows__(iteration, gm), self.__population_rows__(iteration, population))
+
+        if self._writer is None:
+            self.__insert_generation__(*snapshot)
+            return
+
+        self.__raise_writer_error__()
+
+        if self._policy == 'block':
+            self._queue.put(snapshot)
+        else:
+            try:
+                self._queue.put_nowait(snapshot)
+            except Queue.Full:
+                self.n_dropped += 1
+
+    def __insert_generation__(self, prototype_rows, population_rows):
+        with self._conn:  # commits on success, rolls back on exceptions
+            cursor = self._conn.cursor()
+            self.__insert_prototype__(cursor, prototype_rows)
+            self.__insert_population__(cursor, population_rows)
+            cursor.close()
+
+    def write_population(self, iteration, population):
+        """
+        Writes a population with a single statement. Changes are only committed by DatabaseHandler.write_generation,
+        DatabaseHandler.commit or DatabaseHandler.close.
 
-            cursor.execute(_string_insert)
+        :type iteration: int
+        :param iteration: Current iteration.
+        :type population: numpy.ndarray
+        :param population: Current population.
+        """
 
+        cursor = self._conn.cursor()
+        self.__insert_population__(cursor, self.__population_rows__(iteration, population))
         cursor.close()
 
-        if iteration % self.commit_every == 0:
-            self._conn.commit()
+    def __population_rows__(self, iteration, population):
+        return [(
+            self._id_run, iteration, int(ind.ind_id), float(ind.fitness), int(ind.height), int(ind.n_nodes),
+            int(ind.train_acc_score * len(ind.y_train_true)),
+            int(ind.val_acc_score * len(ind.y_val_true))
+            if self.val_hash is not None and ind.val_acc_score is not None else None,
+            int(ind.test_acc_score * len(ind.y_test_true))
+            if self.test_hash is not None and ind.test_acc_score is not None else None,
+            sqlite3.Binary(DecisionTree.pack_encoding(ind.encode(), compress=DatabaseHandler.compress_trees))
+        ) for ind in population]
+
+    @staticmethod
+    def __insert_population__(cursor, rows):
+        cursor.executemany(
+            """INSERT INTO POPULATION (
+                id_run, iteration, individual, fitness, height, n_nodes, train_correct, val_correct, test_correct, tree
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows
+        )
 
     def write_prototype(self, iteration, gm):
         """
+        Writes the non-zero probabilities of a graphical model (see GraphicalModel.to_table) with a single
+        statement. Changes are only committed by DatabaseHandler.write_generation, DatabaseHandler.commit or
+        DatabaseHandler.close.
+
         :type iteration: int
-        :param iteration:
+        :param iteration: Current iteration.
         :type gm: treelib.graphical_model.GraphicalModel
-        :param gm:
-        :return:
+        :param gm: Current graphical model.
         """
+
         cursor = self._conn.cursor()
+        self.__insert_prototype__(cursor, self.__prototype_rows__(iteration, gm))
+        cursor.close()
 
-        for attr in self.attributes:
-            cursor.execute("""
-               INSERT INTO PROTOTYPE (id_run, iteration, attribute, %s) VALUES (
-                %d, %d, '%s', %s
-               )
-            """ % (self._prototype_columns, self._id_run, iteration, attr, ','.join([str(x) for x in gm.attributes.loc[attr]]))
+    def __prototype_rows__(self, iteration, gm):
+        nodes, label_indices, probabilities = gm.to_table()
+
+        # a label index of -1 denotes the mass of unlisted attributes, stored as a NULL attribute
+        attributes = np.append(gm.labels.astype(np.str).astype(np.object), [None])[label_indices].tolist()
+
+        return zip(
+            it.repeat(self._id_run), it.repeat(iteration), nodes.tolist(), attributes, probabilities.tolist()
+        )
+
+    @staticmethod
+    def __insert_prototype__(cursor, rows):
+        cursor.executemany(
+            """INSERT INTO PROTOTYPE (id_run, iteration, node, attribute, probability) VALUES (?, ?, ?, ?, ?)""",
+            rows
+        )
+
+    def read_tree(self, iteration, individual, id_run=None):
+        """
+        Reads a tree from the POPULATION table.
+
+        :type iteration: int
+        :param iteration: Iteration in which the tree was in the population.
+        :type individual: int
+        :param individual: Id of the individual.
+        :type id_run: int
+        :param id_run: optional - unique id of the run. Defaults to the current run.
+        :rtype: dict
+        :return: The encoded tree, as returned by DecisionTree.encode.
+        """
+
+        tree = self.__read_population_tree__(iteration, individual, id_run)
+        if tree is None:
+            raise ValueError(
+                'Individual %d of iteration %d was written with schema version 1 or older, and only its DOT '
+                'is stored; use DatabaseHandler.get_dot instead!' % (individual, iteration)
             )
-        cursor.close()
 
-        if iteration % self.commit_every == 0:
-            self._conn.commit()
+        return DecisionTree.unpack_encoding(tree)
+
+    def __read_population_tree__(self, iteration, individual, id_run=None, dot=False):
+        """
+        Reads the tree column of a row of the POPULATION table; if dot is True, and the table has a dot column
+        (see DatabaseHandler.__upgrade_population__), also reads it.
+        """
+
+        columns = ['tree']
+        if dot and 'dot' in [x[DatabaseHandler.table_info_columns['name']] for x in self._conn.execute(
+                'PRAGMA table_info(POPULATION);'
+        ).fetchall()]:
+            columns += ['dot']
+
+        row = self._conn.execute(
+            """SELECT %s FROM POPULATION WHERE id_run = ? AND iteration = ? AND individual = ?""" % ', '.join(columns),
+            (self._id_run if id_run is None else id_run, int(iteration), int(individual))
+        ).fetchone()
+
+        if row is None:
+            raise KeyError((iteration, individual))
+
+        return row if dot else row[0]
+
+    def get_dot(self, iteration, individual, id_run=None):
+        """
+        Renders a tree from the POPULATION table in the DOT language. Attribute names and class labels are read
+        from the ATTRIBUTES and CLASSES tables. Trees written with schema version 1 or older are returned as stored.
+
+        :type iteration: int
+        :param iteration: Iteration in which the tree was in the population.
+        :type individual: int
+        :param individual: Id of the individual.
+        :type id_run: int
+        :param id_run: optional - unique id of the run. Defaults to the current run.
+        :rtype: str
+        :return: The tree, in the DOT language.
+        """
+
+        row = self.__read_population_tree__(iteration, individual, id_run, dot=True)
+        if row[0] is None and len(row) > 1:
+            return row[1]
+
+        # attributes are written in the same order as the columns of the dataset
+        columns = [x[0] for x in self._conn.execute(
+            """SELECT attribute FROM ATTRIBUTES WHERE dataset_name = ? ORDER BY rowid""", (self.dataset_name,)
+        ).fetchall()]
+        class_labels = [x[0] for x in self._conn.execute(
+            """SELECT class_label FROM CLASSES WHERE dataset_name = ? ORDER BY class_index""", (self.dataset_name,)
+        ).fetchall()]
+
+        return DecisionTree.encoding_to_dot(DecisionTree.unpack_encoding(row[0]), columns, class_labels)
 
     def union(self, db):
         def convert(value, _type):
@@ -279,6 +660,8 @@ class DatabaseHandler(object):
                 return 'NULL'
             if _type == 'TEXT':
                 return str(value).replace("""'""", """''""").join("''")
+            if _type == 'BLOB':
+                return "X'%s'" % binascii.hexlify(value)
             return str(value)
 
         def __insert__(self_cursor, other_cursor, tables, treat=False):
@@ -288,6 +671,16 @@ class DatabaseHandler(object):
                 column_names = ','.join([x[self.table_info_columns['name']] for x in columns])
                 column_types = [x[self.table_info_columns['type']] for x in columns]
 
+                # columns kept by upgrades of older databases (e.g. dot, see __upgrade_population__) are added
+                self_columns = [x[self.table_info_columns['name']] for x in self_cursor.execute(
+                    'PRAGMA TABLE_INFO(%s)' % table_name
+                ).fetchall()]
+                for column in columns:
+                    if column[self.table_info_columns['name']] not in self_columns:
+                        self_cursor.execute('ALTER TABLE %s ADD COLUMN %s %s DEFAULT NULL;' % (
+                            table_name, column[self.table_info_columns['name']], column[self.table_info_columns['type']]
+                        ))
+
                 other_data = other_cursor.execute("""SELECT %s FROM %s;""" % (column_names, table_name)).fetchall()
 
                 for data in other_data:
@@ -307,7 +700,7 @@ class DatabaseHandler(object):
         self_cursor = self._conn.cursor()
 
         # those values must be unique in the main database, but will repeat in partial databases
-        tables = ['evolution', 'attributes', 'sets']
+        tables = ['evolution', 'attributes', 'classes', 'sets']
         __insert__(self_cursor, other_cursor, tables, treat=True)
 
         # those values are also unique, must do not and should not
@@ -506,3 +899,28 @@ class MetaDataset(object):
 
     numerical = 'numerical'
     categorical = 'categorical'
+
+
+def spawn_random_states(random_state, n_children):
+    """
+    Derives independent random number generators from a root seed, in the fashion of seed-sequence spawning:
+    child i is seeded with the root entropy followed by its spawn key, i. Hence, the stream of each child
+    only depends on the root seed and on its position, regardless of the order in which children are used.
+
+    :type random_state: int
+    :param random_state: Root seed, in [0, 2^32). If None, fresh entropy is drawn from the operating system.
+    :type n_children: int
+    :param n_children: Number of generators to derive.
+    :rtype: list
+    :return: A list of numpy.random.RandomState, one per child.
+    """
+
+    if random_state is None:
+        entropy = np.random.RandomState().randint(0, 2 ** 32, size=4, dtype=np.uint64)
+    else:
+        assert 0 <= random_state < 2 ** 32, ValueError('random_state must be in [0, 2^32)!')
+        entropy = [random_state]
+
+    return [
+        np.random.RandomState(np.array(list(entropy) + [spawn_key], dtype=np.uint32)) for spawn_key in xrange(n_children)
+    ]